@@ -14,6 +14,8 @@ sys.path.append(baseLibDir)
 from analysis import Analysis
 
 if __name__ == '__main__':
-    analysis = Analysis('CFMGS/B2')
-    analysis.bandGap(-0.5, 0.4, 0.05)
-    analysis.dosDiff(0.6)
+    analysis = Analysis('CFMGS/B2', workers=os.cpu_count())
+    analysis.run([
+        ('bandGap', {'aInit': -0.5, 'stripSize': 0.4, 'stepSize': 0.05}),
+        ('dosDiff', {'vincinity': 0.6})
+    ])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+""" Time the parsing and analysis hot paths on synthetic SPR-KKR data """
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import inspect
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+
+# Add extra libraries' directories to import list
+benchDir = os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe())))
+sys.path.append(os.path.join(benchDir, '..', 'lib'))
+sys.path.append(benchDir)
+
+# Import own libraries
+import nmod
+import convert
+from analysis import Analysis
+import synthetic
+
+def fileSize(filePaths):
+    """ Return the total size of the files in MB """
+    return sum(os.path.getsize(filePath) for filePath in filePaths) / 1e6
+
+def timeStage(func, repeat):
+    """ Return the best time of a few runs, silencing their output """
+    times = []
+
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            startTime = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - startTime)
+
+    return min(times)
+
+def runBenchmarks(mainDir, names, settings):
+    """ Return the timing results of every stage """
+    rawDir = os.path.join(mainDir, 'raw')
+    dataDir = os.path.join(mainDir, 'data')
+    dosFiles = [os.path.join(rawDir, name, 'dos.agr') for name in names]
+    bsfFiles = [os.path.join(rawDir, name, name + '_5_BLOCHSF_spol.bsf')
+                for name in names]
+    numSites = settings['numSites']
+    repeat = settings['repeat']
+
+    stages = [
+        ('readAgr', dosFiles,
+         lambda: [nmod.readAgr(f) for f in dosFiles]),
+        ('getDOSSpins', dosFiles,
+         lambda: [nmod.getDOSSpins(f) for f in dosFiles]),
+        ('getBSF3D', bsfFiles,
+         lambda: [nmod.getBSF3D(f, 'down', numSites, save=False)
+                  for f in bsfFiles]),
+        ('getBSF2D', bsfFiles,
+         lambda: [nmod.getBSF2D(f, 'down', numSites) for f in bsfFiles]),
+        ('convert', dosFiles + sum([convert.rawBSFFiles(rawDir, name)
+                                    for name in names], []),
+         lambda: [convert.convertCompound(rawDir, dataDir, name,
+                                          force=True) for name in names])
+    ]
+    results = {}
+
+    for stage, inputs, func in stages:
+        seconds = timeStage(func, repeat)
+        results[stage] = {
+            'seconds': seconds,
+            'compounds_per_s': len(names) / seconds,
+            'mb_per_s': fileSize(inputs) / seconds
+        }
+
+    # The analyses read the converted data folder.
+    analysis = Analysis(mainDir, cache=False)
+    analyses = [
+        ('bandGap', ['dos_down.npy'],
+         lambda: analysis.bandGap(-0.5, 0.4, 0.05)),
+        ('meanFreePath', ['5_bsf2d_down.npy'],
+         lambda: analysis.meanFreePath())
+    ]
+
+    for stage, filenames, func in analyses:
+        inputs = [os.path.join(dataDir, name, filename)
+                  for name in names for filename in filenames]
+        seconds = timeStage(func, repeat)
+        results[stage] = {
+            'seconds': seconds,
+            'compounds_per_s': len(names) / seconds,
+            'mb_per_s': fileSize(inputs) / seconds
+        }
+
+    return results
+
+def printResults(results, previous=None):
+    """ Print a table of the results, compared to a previous run if given """
+    header = ['stage', 'seconds', 'compounds/s', 'MB/s']
+    if previous is not None:
+        header.append('speedup')
+    table = [header]
+
+    for stage, result in results.items():
+        row = [stage, '{:.4f}'.format(result['seconds']),
+               '{:.1f}'.format(result['compounds_per_s']),
+               '{:.2f}'.format(result['mb_per_s'])]
+        if previous is not None:
+            if stage in previous['results']:
+                row.append('{:.2f}x'.format(
+                    previous['results'][stage]['seconds']
+                    / result['seconds']))
+            else:
+                row.append('-')
+        table.append(row)
+
+    print(nmod.ntabulate(table))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--compounds', type=int, default=20)
+    parser.add_argument('--NE', type=int, default=200)
+    parser.add_argument('--NK', type=int, default=60)
+    parser.add_argument('--slices', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None,
+                        help='JSON results file (default: results/<time>)')
+    parser.add_argument('--compare', default=None,
+                        help='previous JSON results file to compare with')
+    args = parser.parse_args()
+
+    settings = {
+        'compounds': args.compounds,
+        'NE': args.NE,
+        'NK': args.NK,
+        'slices': args.slices,
+        'numSites': 5,
+        'repeat': args.repeat
+    }
+
+    mainDir = tempfile.mkdtemp(prefix='half_metals_bench_')
+    cwd = os.getcwd()
+
+    try:
+        names, numBytes = synthetic.generate(
+            mainDir, settings['compounds'], NE=settings['NE'],
+            NK=settings['NK'], numSlices=settings['slices'],
+            numSites=settings['numSites'])
+        print('Generated ' + str(len(names)) + ' compounds ('
+              + '{:.1f}'.format(numBytes / 1e6) + ' MB) in ' + mainDir)
+        results = runBenchmarks(mainDir, names, settings)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(mainDir)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'settings': settings,
+        'results': results
+    }
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    printResults(results, previous)
+
+    output = args.output
+    if output is None:
+        resultsDir = os.path.join(benchDir, 'results')
+        if not os.path.isdir(resultsDir):
+            os.makedirs(resultsDir)
+        output = os.path.join(resultsDir,
+                              time.strftime('%Y%m%d-%H%M%S') + '.json')
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print('Results stored in ' + output)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Stand-in for kkrscf6.3MPI and kkrgen6.3MPI for running the job chain
+without SPR-KKR. It creates the files the real programs would from
+scf.inp, dos.inp and bsf.inp in the current directory. The steps listed
+in the STUB_KKR_FAIL environment variable, e.g. 'scf,bsf', fail instead.
+"""
+import os
+import sys
+import zlib
+import shutil
+import inspect
+import numpy as np
+
+# Add extra libraries' directories to import list
+benchDir = os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe())))
+sys.path.append(benchDir)
+
+# Import own libraries
+import synthetic
+
+if __name__ == '__main__':
+    step = os.path.splitext(os.path.basename(sys.argv[-1]))[0]
+    dirname = os.path.basename(os.getcwd())
+    rng = np.random.default_rng(zlib.crc32(dirname.encode()))
+
+    if step in os.environ.get('STUB_KKR_FAIL', '').split(','):
+        print('Stub ' + step + ' failed.')
+        sys.exit(1)
+
+    if step == 'scf':
+        shutil.copyfile('pot.pot', 'pot.pot_new')
+        print('Stub SCF converged.')
+    elif step == 'dos':
+        synthetic.writeDOS('dos.agr', 200, rng)
+        with open(dirname + '_DOS.dos', 'w') as f:
+            f.write('stub DOS\n')
+    elif step == 'bsf':
+        synthetic.writeBSF(dirname + '_5_BLOCHSF_spol.bsf', 60, 5,
+                           0.2 + 0.1 * rng.random(), 0.01, rng)
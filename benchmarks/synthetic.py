@@ -0,0 +1,87 @@
+""" Generate synthetic SPR-KKR DOS and BSF output for benchmarking """
+import os
+import numpy as np
+
+def compoundNames(numCompounds):
+    """ Return B2 style concentration directory names """
+    num = int(np.ceil(np.sqrt(numCompounds)))
+    step = 0.5 / max(num - 1, 1)
+    names = []
+
+    for i in range(numCompounds):
+        x, y = i % num, int(i / num)
+        names.append('1.000_{:.3f}_{:.3f}_{:.3f}_{:.3f}'.format(
+            0.5 - x*step, x*step, 0.5 - y*step, y*step))
+
+    return names
+
+def writeDOS(filePath, NE, rng):
+    """ Write a Grace .agr file with a spin up and a gapped spin down DOS """
+    energies = np.linspace(-1.0, 0.5, NE)
+    up = 2.0 + np.sin(6.0 * energies) + 0.05 * rng.random(NE)
+    gap = 0.1 + 0.1 * rng.random()
+    down = np.where(np.abs(energies + 0.2) < gap, 0.0,
+                    1.5 + np.cos(5.0 * energies)) + 0.05 * rng.random(NE)
+
+    with open(filePath, 'w') as f:
+        f.write('# Grace project file\n@version 50122\n'
+                '@page size 2500, 2500\n')
+        for n, dos in enumerate([up, down]):
+            f.write('@target G' + str(n) + '.S0\n@type xy\n')
+            for x, y in zip(energies, dos):
+                f.write('{:14.6f}{:14.6f}\n'.format(x, y))
+            f.write('&\n')
+
+def writeBSF(filePath, NK, numSites, peak, width, rng):
+    """
+    Write a spin polarised BSF file with (numSites - 1) * 2 blocks of
+    NK * NK values, two fixed width values per line, after three '###'
+    header lines. The first strip holds a Lorentzian peak at k = peak
+    and its mirror image at k = 1 - peak.
+    """
+    numUseful = (numSites - 1) * 2
+    nk2 = NK * NK
+    values = 0.01 * rng.random(numUseful * nk2)
+    k = np.arange(NK) / NK
+
+    for k0 in [peak, 1.0 - peak]:
+        values[:NK] += width*width / ((k - k0)*(k - k0) + width*width)
+
+    with open(filePath, 'w') as f:
+        f.write('###\n# BLOCHSF synthetic header\n###\n'
+                '# NK1 = ' + str(NK) + ' NK2 = ' + str(NK) + '\n###\n')
+        lines = values.reshape(-1, 2)
+        f.write(''.join('{:16.8E}{:16.8E}\n'.format(a, b) for a, b in lines))
+
+def generate(mainDir, numCompounds, NE=200, NK=60, numSlices=10,
+             numSites=5, seed=0):
+    """
+    Generate raw/<compound>/dos.agr and <compound>_<n>_BLOCHSF_spol.bsf
+    for every compound. Return the compound names and input bytes written.
+    """
+    rng = np.random.default_rng(seed)
+    names = compoundNames(numCompounds)
+    numBytes = 0
+
+    for dirname in names:
+        compoundDir = os.path.join(mainDir, 'raw', dirname)
+        if not os.path.isdir(compoundDir):
+            os.makedirs(compoundDir)
+
+        dosFile = os.path.join(compoundDir, 'dos.agr')
+        writeDOS(dosFile, NE, rng)
+        numBytes += os.path.getsize(dosFile)
+
+        # The peak moves linearly with energy across the slices.
+        peak = 0.15 + 0.1 * rng.random()
+        for n in range(1, numSlices + 1):
+            bsfFile = os.path.join(compoundDir, dirname + '_' + str(n)
+                                   + '_BLOCHSF_spol.bsf')
+            writeBSF(bsfFile, NK, numSites, peak + 0.005 * n, 0.02, rng)
+            numBytes += os.path.getsize(bsfFile)
+
+    for folder in ['data', 'analysis']:
+        if not os.path.isdir(os.path.join(mainDir, folder)):
+            os.makedirs(os.path.join(mainDir, folder))
+
+    return names, numBytes
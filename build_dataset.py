@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+""" Stack the DOS of every compound into a single dataset """
+import os
+import sys
+import inspect
+
+# Add extra libraries' directories to import list
+baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe()))), 'lib')
+
+sys.path.append(baseLibDir)
+
+# Import own libraries
+from analysis import Analysis
+from dataset import buildDataset
+
+if __name__ == '__main__':
+    analysis = Analysis('CFMGS/B2')
+    dataset = buildDataset(analysis)
+    print('Stored ' + str(len(dataset['names'])) + ' compounds with '
+          + str(len(dataset['energies'])) + ' energies in '
+          + os.path.join(analysis.mainDir, 'dataset', 'dataset.npz') + '.')
@@ -1,30 +1,22 @@
 #!/usr/bin/env python
-""" Get DOS data and move it to the data folder """
+""" Convert the raw DOS and BSF data of every compound to the data folder """
 import os
 import sys
 import inspect
 
-baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
-    inspect.getfile(inspect.currentframe()))), 'lib')
+baseDir = os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe())))
+baseLibDir = os.path.join(baseDir, 'lib')
 
 sys.path.append(baseLibDir)
 
 # Import own libraries
-import nmod
+from convert import convertAll
 
-os.chdir(os.path.join('CFMGS', 'B2'))
-cwd = os.getcwd()
+if __name__ == '__main__':
+    # Usage: get_dos.py [mainDir] [--force]
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    mainDir = args[0] if len(args) != 0 else os.path.join('CFMGS', 'B2')
 
-for dirname in sorted(os.listdir('raw')):
-    filePath = os.path.join(cwd, 'raw', dirname, 'dos.agr')
-    nmod.getDOS(filePath, 'up')
-    nmod.getDOS(filePath, 'down')
-
-    if not os.path.isdir(os.path.join('data', dirname)):
-        os.makedirs(os.path.join('data', dirname))
-
-    os.rename(os.path.join('raw', dirname, 'dos_up.txt'),
-              os.path.join('data', dirname, 'dos_up.txt'))
-
-    os.rename(os.path.join('raw', dirname, 'dos_down.txt'),
-              os.path.join('data', dirname, 'dos_down.txt'))
+    convertAll(os.path.join(baseDir, mainDir), workers=os.cpu_count(),
+               force='--force' in sys.argv)
@@ -2,11 +2,12 @@
 import os
 import sys
 import inspect
+import re
 import math
 import time
-from operator import itemgetter
-from scipy import integrate
-from scipy.optimize import curve_fit
+import cProfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # Add extra libraries' directories to import list
 baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
@@ -15,72 +16,435 @@ sys.path.append(baseLibDir)
 
 # Import own libraries
 import nmod
+from cache import ResultCache, resultKey
+import fitting
+from timing import StageTimer, Progress, RunReport, printSummary
+from sink import TABLE_FORMATS, TextSink, TableSink
 
-def checkAnalysisFiles(outFile, normalisedFile):
+def loadData(dataFile, timer=None):
     """
-    Check if the analysis file already exists,
-    if it does, then remove it.
+    Load x and y data from the binary cache or the text file of the data
+    folder, creating the binary cache from the text file if it is missing.
+    Return None if neither exists.
     """
-    if os.path.isfile(outFile) is True:
-        os.remove(outFile)
+    if timer is None:
+        timer = StageTimer()
 
-    if os.path.isfile(normalisedFile) is True:
-        os.remove(normalisedFile)
+    with timer.stage('read'):
+        data = nmod.loadCache(dataFile)
 
-def getDOS(dosFile, rawFile, spin):
+    if data is None and os.path.isfile(dataFile):
+        with timer.stage('parse'):
+            data = np.loadtxt(dataFile, dtype=np.float64, ndmin=2)
+        with timer.stage('write'):
+            nmod.saveCache(dataFile, data)
+
+    return data
+
+def getBSF2D(bsfFile, rawFile, spin, numSites, timer=None):
     """
-    Get DOS data from either the data folder or the raw folder.
+    Get 2D BSF data from either the data folder or the raw folder.
     It's faster if the data is in the data folder,
     where it's supposed to be processed.
     """
-    dos = []
-
-    if os.path.isfile(dosFile):
-        with open(dosFile) as f:
-            for l in f:
-                line = l.rstrip()
-                x = float(line.split()[0])
-                y = float(line.split()[1])
-                dos.append([x, y])
-    else:
-        dos = nmod.getDOS(rawFile, spin)
+    if timer is None:
+        timer = StageTimer()
+
+    bsf = loadData(bsfFile, timer)
 
-    return dos
+    if bsf is None:
+        with timer.stage('parse'):
+            bsf = np.asarray(nmod.getBSF2D(rawFile, spin, numSites),
+                             dtype=np.float64)
 
-def getBSF2D(bsfFile, rawFile, spin, numSites):
+    return bsf
+
+def cumulativeIntegral(x, y, points):
     """
-    Get 2D BSF data from either the data folder or the raw folder.
-    It's faster if the data is in the data folder,
-    where it's supposed to be processed.
+    Exact integral of the linearly interpolated data from x[0] to each point.
+    The cumulative trapezoid integral is only computed at the data points,
+    the partial segment up to each point is then added analytically.
+    y may hold several datasets on the same x along its leading axes.
+    Points outside the range of x raise a ValueError, as interpolating
+    the data did.
+    """
+    points = np.asarray(points)
+
+    if np.any(points < x[0]) or np.any(points > x[-1]):
+        raise ValueError('A value in x_new is outside the interpolation '
+                         'range [' + str(x[0]) + ', ' + str(x[-1]) + '].')
+
+    cumulative = np.cumsum(0.5 * np.diff(x) * (y[..., 1:] + y[..., :-1]),
+                           axis=-1)
+    cumulative = np.concatenate((np.zeros(y.shape[:-1] + (1,)), cumulative),
+                                axis=-1)
+    k = np.clip(np.searchsorted(x, points, side='right') - 1, 0, len(x) - 2)
+    slope = (y[..., k+1] - y[..., k]) / (x[k+1] - x[k])
+    dx = points - x[k]
+
+    return cumulative[..., k] + dx * (y[..., k] + 0.5 * slope * dx)
+
+def stripIntegrals(dos, aInit, stripSize, stepSize, iterations):
+    """ Integrals of a fixed width strip translated across the DOS data """
+    dos = np.asarray(dos, dtype=float)
+    x, y = dos[:, 0], dos[:, 1]
+    a = aInit + np.arange(iterations) * stepSize
+    b = a + stripSize
+
+    return cumulativeIntegral(x, y, b) - cumulativeIntegral(x, y, a)
+
+class CompoundData(object):
+    """
+    DOS and BSF data of a single compound, loaded on first use and kept
+    so that every metric run on the compound shares the same data.
+    The time spent loading and analysing the data is kept in timer.
+    """
+    def __init__(self, dataDir, rawDir, dirname):
+        self.dataDir = os.path.join(dataDir, dirname)
+        self.rawDir = os.path.join(rawDir, dirname)
+        self.dirname = dirname
+        self.loaded = {}
+        self.timer = StageTimer()
+
+    def sourceFiles(self, key):
+        """
+        Return the data file, its binary cache and the raw file
+        that the data of the given key is loaded from.
+        """
+        if key[0] == 'dos':
+            dataFile = os.path.join(self.dataDir, 'dos_' + key[1] + '.txt')
+            rawFile = os.path.join(self.rawDir, 'dos.agr')
+        else:
+            dataFile = os.path.join(self.dataDir, str(key[1]) + '_bsf2d_'
+                                    + key[2] + '.txt')
+            rawFile = os.path.join(self.rawDir, self.dirname + '_'
+                                   + str(key[1]) + '_BLOCHSF_spol.bsf')
+
+        return [dataFile, nmod.cachePath(dataFile), rawFile]
+
+    def bsfNumbers(self, spin):
+        """ Return the numbers of all the BSF energy slices available """
+        numbers = set()
+        dataPattern = re.compile(r'^(\d+)_bsf2d_' + spin + r'\.(txt|npy)$')
+        rawPattern = re.compile('^' + re.escape(self.dirname)
+                                + r'_(\d+)_BLOCHSF_spol\.bsf$')
+
+        for folder, pattern in [(self.dataDir, dataPattern),
+                                (self.rawDir, rawPattern)]:
+            if os.path.isdir(folder):
+                for filename in os.listdir(folder):
+                    match = pattern.match(filename)
+                    if match:
+                        numbers.add(int(match.group(1)))
+
+        return sorted(numbers)
+
+    def inputFiles(self, keys):
+        """
+        Return the files that the data of the given keys depend on,
+        which is the first existing source file of each key.
+        """
+        inputs = []
+
+        for key in keys:
+            for sourceFile in self.sourceFiles(key):
+                if os.path.isfile(sourceFile):
+                    inputs.append(sourceFile)
+                    break
+
+        return inputs
+
+    def dos(self, spin):
+        """ Return the DOS data of the given spin """
+        key = ('dos', spin)
+
+        if key not in self.loaded:
+            dosFile, _, rawFile = self.sourceFiles(key)
+            dos = loadData(dosFile, self.timer)
+
+            if dos is None:
+                # Both spins come from the same raw file, so read it once.
+                with self.timer.stage('parse'):
+                    rawDOS = nmod.getDOSSpins(rawFile)
+                for rawSpin, spinDOS in rawDOS.items():
+                    self.loaded.setdefault(('dos', rawSpin), spinDOS)
+            else:
+                self.loaded[key] = dos
+
+        return self.loaded[key]
+
+    def bsf2D(self, bsfnum, spin):
+        """ Return the 2D BSF data of the given BSF number and spin """
+        key = ('bsf2d', bsfnum, spin)
+
+        if key not in self.loaded:
+            bsfFile, _, rawFile = self.sourceFiles(key)
+            self.loaded[key] = getBSF2D(bsfFile, rawFile, spin, 5,
+                                        self.timer)
+
+        return self.loaded[key]
+
+def bandGapCompound(data, aInit, stripSize, stepSize):
+    """ Minimum integral of the spin down DOS of a single compound """
+    iterations = int(math.fabs(aInit) / stepSize) + 1
+    dos = data.dos('down')
+
+    # Calculate minimum integral by translating a fixed width strip.
+    with data.timer.stage('integrate'):
+        integrals = stripIntegrals(dos, aInit, stripSize, stepSize,
+                                   iterations)
+        bandGap = float(np.min(integrals))
+
+    return bandGap
+
+def fermiCorrection(dos, vincinity):
+    """
+    Correction to the Fermi level from the DOS data, the energy of the
+    minimum DOS within vincinity of the Fermi level.
+    Return None if no energy lies within vincinity.
+    """
+    energies = dos[:, 0]
+    masked = np.where(np.abs(energies) < vincinity, dos[:, 1], np.inf)
+
+    if not np.isfinite(masked).any():
+        return None
+
+    return energies[np.argmin(masked)]
+
+def dosDiffCompound(data, vincinity, shift=False):
+    """
+    Difference between spin up and down DOS of a single compound,
+    at the corrected Fermi level. With shift, the energies of the whole
+    dataset are shifted by the correction instead and the difference is
+    taken at E-E_f = 0eV of the shifted grid.
+    """
+    dosUp = data.dos('up')
+    dosDown = data.dos('down')
+
+    with data.timer.stage('interpolate'):
+        correction = fermiCorrection(dosDown, vincinity)
+
+        if correction is None:
+            print('\n' + data.dirname + ' has no DOS data within '
+                  + str(vincinity) + 'eV of the Fermi level '
+                  + 'for the DOS difference analysis.')
+            nmod.nexit()
+
+        # Evaluating at -correction is the same as shifting the whole
+        # dataset by the correction and evaluating at 0, without copying.
+        energy = -correction if shift else correction
+
+        # Calculate the difference between the DOS at E-E_f = 0eV.
+        dosDiff = (np.interp(energy, dosUp[:, 0], dosUp[:, 1])
+                   - np.interp(energy, dosDown[:, 0], dosDown[:, 1]))
+
+    return float(dosDiff)
+
+def peakPositions(k, strips):
+    """
+    Position of the peak in the first half of every strip, refined below
+    the k grid spacing by fitting a parabola through the three points
+    around the maximum.
+    """
+    half = strips[:, :int(strips.shape[1] / 2)]
+    rows = np.arange(len(half))
+    index = np.clip(np.argmax(half, axis=1), 1, half.shape[1] - 2)
+    left, centre, right = (half[rows, index-1], half[rows, index],
+                           half[rows, index+1])
+    curvature = left - 2*centre + right
+    delta = np.where(curvature < 0, 0.5 * (left - right)
+                     / np.where(curvature < 0, curvature, 1), 0.0)
+
+    return k[index] + np.clip(delta, -0.5, 0.5) * (k[1] - k[0])
+
+def fermiVelocityCompound(data, dE, numSlices=10):
+    """
+    Fermi velocity of a single compound, from the slope of the energy
+    against the peak position over all the BSF energy slices.
+    The slices 1 to numSlices are evenly spaced in energy and dE is the
+    energy between the first and last of them, so the energy of every
+    slice found follows from its number, even if some are missing.
+    """
+    numbers = data.bsfNumbers('down')
+
+    if len(numbers) < 2:
+        print('\n' + data.dirname + ' needs at least 2 BSF energy slices '
+              + 'for the Fermi velocity analysis.')
+        nmod.nexit()
+
+    if numbers[0] < 1 or numbers[-1] > numSlices:
+        print('\n' + data.dirname + ' has BSF energy slices outside 1 to '
+              + str(numSlices) + ' for the Fermi velocity analysis.')
+        nmod.nexit()
+
+    # Load all the slices into a single (slices, nk) array.
+    bsfDown = [data.bsf2D(n, 'down') for n in numbers]
+    k = np.asarray(bsfDown[0][:, 0])
+    strips = np.stack([bsf[:, 1] for bsf in bsfDown])
+
+    with data.timer.stage('fit'):
+        # The slices are evenly spaced in energy.
+        numbers = np.array(numbers, dtype=float)
+        energies = (numbers - 1) * dE / (numSlices - 1)
+        kPeaks = peakPositions(k, strips)
+
+        # Calculate Fermi velocity by linear regression of E against k.
+        kMean = kPeaks - kPeaks.mean()
+        vf = ((kMean * (energies - energies.mean())).sum()
+              / (kMean * kMean).sum())
+
+    return float(vf)
+
+def fermiVelocityInputs(data):
+    """ Data used by the Fermi velocity analysis """
+    return [('bsf2d', n, 'down') for n in data.bsfNumbers('down')]
+
+def meanFreePathCompound(data):
+    """ Fermi level BSF peak of a single compound, fitted in a batch later """
+    # Get the 2D BSF data at Fermi level.
+    bsfDown = data.bsf2D(5, 'down')
+
+    # First crop half of the data to remove the other peak,
+    # then get the position of the peak by finding the position of max.
+    truncated = bsfDown[:int(len(bsfDown) / 2)]
+    index = np.argmax(truncated[:, 1])
+
+    # Perform further cropping.
+    dataDel = int(2*index - len(truncated))
+    truncated = truncated[max(dataDel, 0):]
+
+    return np.array(truncated[:, 0]), np.array(truncated[:, 1])
+
+def meanFreePathBatch(dirnames, peaks, mode='fit'):
+    """
+    Fit the Fermi level BSF peaks of all the compounds at once.
+    The 'fit' mode fits Lorentzians, the 'hwhm' mode only uses the
+    closed-form half width at half maximum.
+    Return the mean free path, peak width and fit residual of each compound.
     """
-    bsf = []
-
-    if os.path.isfile(bsfFile):
-        with open(bsfFile) as f:
-            for l in f:
-                line = l.rstrip()
-                x = float(line.split()[0])
-                y = float(line.split()[1])
-                bsf.append([x, y])
+    if len(peaks) == 0:
+        return []
+
+    X, Y, mask = fitting.stack(peaks)
+    x0, width, I = fitting.halfWidths(X, Y, mask)
+
+    if mode == 'hwhm':
+        params = np.column_stack((x0, width, I))
+        model = fitting.lorentzian(X, x0[:, None], width[:, None], I[:, None])
+        rms = np.sqrt((((model - Y) * mask)**2).sum(axis=1) / mask.sum(axis=1))
     else:
-        bsf = nmod.getBSF2D(rawFile, spin, numSites)
+        params, rms, converged = fitting.fitLorentzians(
+            X, Y, mask, np.column_stack((x0, width, I)))
+
+        for dirname in np.array(dirnames)[~converged]:
+            print('\nWarning: the Lorentzian fit of ' + dirname
+                  + ' did not converge.')
+
+    return [[float(1 / params[n, 1]), float(params[n, 1]), float(rms[n])]
+            for n in range(len(peaks))]
+
+# Available metrics. Each has a name, an output file name, a per compound
+# function, the sign applied to the results before normalising and the data
+# it uses, or a function returning it. A batch function may turn the per
+# compound outputs of all the compounds into results at once, the parameters
+# in batchParams are then only passed to it, and results with several
+# columns are stored in a separate file, the first column being the metric
+# value.
+METRICS = {
+    'bandGap': {
+        'name': 'band gap',
+        'fileName': 'band_gap',
+        'compound': bandGapCompound,
+        'sign': -1,
+        'inputs': [('dos', 'down')]
+    },
+    'dosDiff': {
+        'name': 'DOS difference',
+        'fileName': 'dos_diff',
+        'compound': dosDiffCompound,
+        'sign': 1,
+        'inputs': [('dos', 'up'), ('dos', 'down')]
+    },
+    'fermiVelocity': {
+        'name': 'Fermi velocity',
+        'fileName': 'fermi_velocity',
+        'compound': fermiVelocityCompound,
+        'sign': 1,
+        'inputs': fermiVelocityInputs
+    },
+    'meanFreePath': {
+        'name': 'mean free path',
+        'fileName': 'mean_free_path',
+        'compound': meanFreePathCompound,
+        'batch': meanFreePathBatch,
+        'batchParams': ['mode'],
+        'columns': ['mean_free_path', 'width', 'residual'],
+        'sign': 1,
+        'inputs': [('bsf2d', 5, 'down')]
+    }
+}
+
+def runCompound(dataDir, rawDir, dirname, metrics):
+    """
+    Load a single compound once and run every requested metric on it.
+    Return the results in the same order as the metrics, None for the
+    metrics that failed, the time spent in each stage and the reason
+    of each failure by metric index.
+    """
+    data = CompoundData(dataDir, rawDir, dirname)
+    results = []
+    errors = {}
+
+    for i, (func, params) in enumerate(metrics):
+        # A metric failing on this compound, even through nmod.nexit,
+        # only skips its result instead of stopping the whole run.
+        try:
+            results.append(func(data, **params))
+        except (Exception, SystemExit) as e:
+            results.append(None)
+            errors[i] = str(e) or 'exited'
+
+    return results, data.timer.timings, errors
+
+def compoundArgs(metric, params):
+    """
+    Return the per compound function of a metric with its parameters,
+    leaving out those only used by its batch function.
+    """
+    batchParams = metric.get('batchParams', [])
 
-    return bsf
+    return (metric['compound'],
+            dict([(key, value) for key, value in params.items()
+                  if key not in batchParams]))
 
-def lorentzian(x0, I):
-    """ Lorentzian with 1 peak """
-    return lambda x, y: (I * y*y) / ( (x - x0)*(x - x0) + y*y )
+def callCompound(task):
+    """ Unpack and run a single compound task, used by the process pool """
+    func, args = task
+    return func(*args)
 
 class Analysis(object):
-    """ Analysis base class """
-    def __init__(self, mainDir):
+    """
+    Analysis base class. With allowEmpty, the raw and data folders are
+    created if needed and may have no compounds yet, e.g. to watch them.
+    """
+    def __init__(self, mainDir, workers=1, cache=True, hashContent=False,
+                 profile=False, table=None, flushInterval=60,
+                 allowEmpty=False):
         baseDir = os.path.join(os.path.dirname(os.path.realpath(
             inspect.getfile(inspect.currentframe()))), '..')
         self.mainDir = os.path.join(baseDir, mainDir)
         self.rawDir = os.path.join(self.mainDir, 'raw')
         self.dataDir = os.path.join(self.mainDir, 'data')
         self.analysisDir = os.path.join(self.mainDir, 'analysis')
+        self.cacheDir = os.path.join(self.analysisDir, 'cache')
+        self.reportDir = os.path.join(self.analysisDir, 'reports')
         self.listDataDir = []
+        self.workers = workers
+        self.cache = cache
+        self.hashContent = hashContent
+        self.profile = profile
+        self.table = table
+        self.flushInterval = flushInterval
         error = False
         
         # Check if the required directories exist
@@ -88,332 +452,286 @@ class Analysis(object):
             print('The directory provided does not exists.')
             error = True
 
-        if (os.path.isdir(self.rawDir) is False
+        if table is not None and table not in TABLE_FORMATS:
+            print('The results table format must be one of '
+                  + ', '.join(TABLE_FORMATS) + '.')
+            error = True
+
+        if allowEmpty and os.path.isdir(self.mainDir):
+            for folder in [self.rawDir, self.dataDir]:
+                if os.path.isdir(folder) is False:
+                    os.makedirs(folder)
+            self.refresh()
+        elif (os.path.isdir(self.rawDir) is False
                 and os.path.isdir(self.dataDir) is False):
             print('The directory provided does have a raw or data folder.')
             error = True
-        else:
-            # Check if there are any data in the raw folder.
-            numTotal = 0
-
-            if os.path.isdir(self.dataDir) is True:
-                numData = len([dirname for dirname in os.listdir(self.dataDir)
-                    if os.path.isdir(os.path.join(self.dataDir, dirname))])
-                if numData != 0:
-                    numTotal += numData
-                    self.listDataDir = sorted(os.listdir(self.dataDir))
-
-            if os.path.isdir(self.rawDir) is True:
-                numRaw = len([dirname for dirname in os.listdir(self.rawDir)
-                    if os.path.isdir(os.path.join(self.rawDir, dirname))])
-                if numRaw != 0 and len(self.listDataDir) == 0:
-                    numTotal += numRaw
-                    self.listDataDir = sorted(os.listdir(self.dataDir))
-
-            if numTotal == 0:
-                print('No data in ' + os.path.join(mainDir, 'data'))
-                print('or in ' + os.path.join(mainDir, 'raw') + ',')
-                print('Make sure that your data are in one of those folders.')
-                error = True 
+        elif len(self.refresh()) == 0:
+            print('No data in ' + os.path.join(mainDir, 'data'))
+            print('or in ' + os.path.join(mainDir, 'raw') + ',')
+            print('Make sure that your data are in one of those folders.')
+            error = True 
+
         if error:
             nmod.nexit()
         else:
             os.chdir(self.mainDir)
 
-    def bandGap(self, aInit, stripSize, stepSize):
-        """ Band gap analysis """
-        print('Running band gap analysis...')
-        iterations = int(math.fabs(aInit) / stepSize) + 1
-        concentrations = []
-        I_bg = []
-        normalised = []
-        outFile = os.path.join(self.analysisDir, 'band_gap.txt')
-        normalisedFile = os.path.join(self.analysisDir,
-                                      'band_gap_normalised.txt')
-
-        checkAnalysisFiles(outFile, normalisedFile)
-
-        # Define time variables for calculating time left.
-        numData = len(self.listDataDir)
-        numDataLeft = numData
+    def refresh(self):
+        """
+        Update and return the list of compounds found in the data
+        and raw folders.
+        """
+        dirnames = set()
+
+        for folder in [self.dataDir, self.rawDir]:
+            if os.path.isdir(folder) is True:
+                dirnames.update([dirname for dirname in os.listdir(folder)
+                    if os.path.isdir(os.path.join(folder, dirname))])
+
+        self.listDataDir = sorted(dirnames)
+
+        return self.listDataDir
+
+    def mapCompounds(self, func, argsList, callback=None):
+        """
+        Run func(dataDir, rawDir, dirname, *args) for every
+        (dirname, args) pair, in a process pool if more than one worker
+        is requested. Return the results in the same order.
+        callback(index, result) is called as soon as each result arrives.
+        """
+        tasks = [(func, (self.dataDir, self.rawDir, dirname) + args)
+                 for dirname, args in argsList]
+        results = []
+        numData = len(tasks)
+        progress = Progress(numData)
+
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+            chunksize = max(1, int(numData / (self.workers * 4)))
+            resultsIter = executor.map(callCompound, tasks,
+                                       chunksize=chunksize)
+        else:
+            executor = None
+            resultsIter = map(callCompound, tasks)
+
+        try:
+            for result in resultsIter:
+                results.append(result)
+                if callback is not None:
+                    callback(len(results) - 1, result)
+                progress.update()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return results
+
+    def run(self, metrics):
+        """
+        Run several metrics in a single pass over the compounds.
+        Each metric is either its name or a (name, parameters) pair, e.g.
+        [('bandGap', {'aInit': -0.5, 'stripSize': 0.4, 'stepSize': 0.05}),
+         ('dosDiff', {'vincinity': 0.6}), 'meanFreePath'].
+        A report of the time spent in every stage is stored in
+        analysis/reports, with a cProfile dump if profile is set.
+        """
+        requested = []
+
+        for metric in metrics:
+            if isinstance(metric, str):
+                metric = (metric, {})
+
+            if metric[0] not in METRICS:
+                print(metric[0] + ' is not an available metric.')
+                nmod.nexit()
+
+            requested.append((metric[0], metric[1]))
+
+        report = RunReport([[name, params] for name, params in requested])
+        profiler = cProfile.Profile() if self.profile else None
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            self.runMetrics(requested, report)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+        # Store the timings of the run, and its profile if requested,
+        # numbering the runs started in the same millisecond.
+        reportName = (time.strftime('%Y%m%d-%H%M%S', time.localtime(
+            report.startTime)) + '.%03d' % (report.startTime % 1 * 1000)
+            + '_' + '_'.join([METRICS[name]['fileName']
+                              for name, _ in requested]))
+        reportFile = os.path.join(self.reportDir, reportName)
+        number = 1
+
+        while os.path.exists(reportFile + '.json'):
+            number += 1
+            reportFile = os.path.join(self.reportDir,
+                                      reportName + '_' + str(number))
+        printSummary(report.save(reportFile + '.json'))
+
+        if profiler is not None:
+            profiler.dump_stats(reportFile + '.prof')
+
+        print('Run report stored in ' + reportFile + '.json')
+
+    def runMetrics(self, requested, report):
+        """
+        Run the (name, parameters) pairs of metrics, recording the time
+        spent in every stage in the report.
+        """
+        names = [METRICS[name]['name'] for name, _ in requested]
+        print('Running ' + ', '.join(names) + ' analysis...')
         startTime = time.time()
-        prevTime = startTime
-        eachTimeTaken = []
-        
-        # Start the analysis process.
-        for dirname in self.listDataDir:
-            # Get DOS data.
-            dosFile = os.path.join(self.dataDir, dirname, 'dos_down.txt')
-            rawFile = os.path.join(self.rawDir, dirname, 'dos.agr')
-            dos = getDOS(dosFile, rawFile, 'down')
-
-            # Linearly interpolate the DOS data.
-            dosInterp = nmod.getInterp1d(dos)
-            integrals = []
-
-            # Calculate minimum integral by translating a fixed width strip.
-            for i in range(iterations):
-                delta = i * stepSize
-                a = aInit + delta 
-                b = aInit + stripSize + delta
-                integral = integrate.quad(dosInterp, a, b, limit=100)[0]
-                integrals.append(integral)
-
-            minIntegral = min(integrals)
-            I_bg.append(-minIntegral)
-            concentrations.append(dirname)
-
-            with open(outFile, 'a+') as f:
-                f.write(dirname + ' ' + str(minIntegral) + '\n')
-
-            # Calculate time left.
-            eachTimeTaken.append(time.time() - prevTime)
-            prevTime = time.time()
-            numDataLeft -= 1
-            sys.stdout.write('\r' + str(numDataLeft) + '/' + str(numData)
-                             + ' - Time left: ' + nmod.seconds2str(
-                             nmod.findMean(eachTimeTaken) * numDataLeft)
-                             + '         ')
-            sys.stdout.flush()
-
-        # Normalise the data and store as a new file.
-        normalised = nmod.normalise(I_bg)
-        print('\nNormalising band gap data...')
-        with open(normalisedFile, 'a+') as f:
-            for i in range(len(normalised)):
-                f.write(concentrations[i] + ' ' + str(normalised[i]) + '\n')
-
-        print('Band gap analysis completed. Time taken: '
+
+        # Find the results that are not cached or whose inputs changed.
+        caches = [ResultCache(self.cacheDir, METRICS[name]['fileName'])
+                  for name, _ in requested]
+        keys = [[None] * len(requested) for _ in self.listDataDir]
+        argsList = []
+        missingList = []
+
+        # Buffer the results of every metric and write them in one go.
+        metrics = [METRICS[name] for name, _ in requested]
+        sinks = [TextSink(self.analysisDir, metrics, self.listDataDir)]
+        if self.table is not None:
+            sinks.append(TableSink(self.analysisDir, metrics,
+                                   self.listDataDir, self.table))
+
+        for n, dirname in enumerate(self.listDataDir):
+            data = CompoundData(self.dataDir, self.rawDir, dirname)
+            missing = []
+
+            for i, (name, params) in enumerate(requested):
+                result = None
+
+                if self.cache:
+                    with report.run.stage('cache'):
+                        inputs = METRICS[name]['inputs']
+                        if callable(inputs):
+                            inputs = inputs(data)
+                        inputs = data.inputFiles(inputs)
+                        keys[n][i] = resultKey(inputs, params,
+                                               self.hashContent)
+                        result = caches[i].get(dirname, keys[n][i])
+
+                if result is None:
+                    missing.append(i)
+                else:
+                    for sink in sinks:
+                        sink.add(i, dirname, result)
+
+            if len(missing) != 0:
+                metricsArgs = [compoundArgs(METRICS[requested[i][0]],
+                                            requested[i][1])
+                               for i in missing]
+                argsList.append((dirname, (metricsArgs,)))
+                missingList.append((n, missing))
+
+        print(str(len(argsList)) + '/' + str(len(self.listDataDir))
+              + ' compounds to analyse.')
+
+        def flush():
+            """ Write the caches and the results gathered so far """
+            if self.cache:
+                with report.run.stage('cache'):
+                    for cache in caches:
+                        cache.save()
+
+            with report.run.stage('write'):
+                for sink in sinks:
+                    sink.flush()
+
+        # Outputs of the batch metrics, which need every compound first.
+        outputs = [([], []) for _ in requested]
+        failed = []
+        lastFlush = [time.time()]
+
+        def gather(index, computed):
+            """ Buffer the results of a compound as soon as they arrive """
+            n, missing = missingList[index]
+            dirname = self.listDataDir[n]
+            values, timings, errors = computed
+            report.addCompound(dirname, timings)
+
+            for j, (i, value) in enumerate(zip(missing, values)):
+                # Failed results are neither stored nor cached,
+                # so they are tried again on the next run.
+                if j in errors:
+                    failed.append([dirname, metrics[i]['name'], errors[j]])
+                    continue
+
+                if 'batch' in metrics[i]:
+                    outputs[i][0].append(n)
+                    outputs[i][1].append(value)
+                    continue
+
+                if self.cache:
+                    caches[i].set(dirname, keys[n][i], value)
+                for sink in sinks:
+                    sink.add(i, dirname, value)
+
+            # Checkpoint the partial results in case the run is killed.
+            if time.time() - lastFlush[0] >= self.flushInterval:
+                flush()
+                lastFlush[0] = time.time()
+
+        try:
+            # Analyse the compounds that are missing any results.
+            with report.run.stage('compounds'):
+                self.mapCompounds(runCompound, argsList, gather)
+            print('')
+
+            for i, (name, params) in enumerate(requested):
+                if 'batch' not in metrics[i]:
+                    continue
+
+                indices, values = outputs[i]
+                with report.run.stage('batch'):
+                    values = metrics[i]['batch'](
+                        [self.listDataDir[n] for n in indices], values,
+                        **params)
+
+                for n, value in zip(indices, values):
+                    if self.cache:
+                        caches[i].set(self.listDataDir[n], keys[n][i], value)
+                    for sink in sinks:
+                        sink.add(i, self.listDataDir[n], value)
+
+            # Store the results of every metric and their normalised values.
+            for metric in metrics:
+                print('Normalising ' + metric['name'] + ' data...')
+        finally:
+            # Write what was gathered even if the run fails partway,
+            # so that the results since the last checkpoint survive.
+            flush()
+
+        if len(failed) != 0:
+            print(str(len(failed)) + ' results could not be computed '
+                  + 'and were skipped:')
+            print(nmod.ntabulate(failed))
+
+        print('Analysis completed. Time taken: '
                + nmod.seconds2str(time.time() - startTime))
 
-    def dosDiff(self, vincinity):
+    def bandGap(self, aInit, stripSize, stepSize):
+        """ Band gap analysis """
+        self.run([('bandGap', {'aInit': aInit, 'stripSize': stripSize,
+                               'stepSize': stepSize})])
+
+    def dosDiff(self, vincinity, shift=False):
         """ Difference between spin up and down DOS """
-        print('Running DOS difference analysis...')
-        concentrations = []
-        I_dos = []
-        normalised = []
-        outFile = os.path.join(self.analysisDir, 'dos_diff.txt')
-        normalisedFile = os.path.join(self.analysisDir,
-                                      'dos_diff_normalised.txt')
-
-        checkAnalysisFiles(outFile, normalisedFile)
-
-        # Define time variables for calculating time left.
-        numData = len(self.listDataDir)
-        numDataLeft = numData
-        startTime = time.time()
-        prevTime = startTime
-        eachTimeTaken = []
-
-        # Start the analysis process.
-        for dirname in self.listDataDir:
-            # Get DOS data.
-            dosUpFile = os.path.join(self.dataDir, dirname, 'dos_up.txt')
-            dosDownFile = os.path.join(self.dataDir, dirname, 'dos_down.txt')
-            rawFile = os.path.join(self.rawDir, dirname, 'dos.agr')
-            dosUp = getDOS(dosUpFile, rawFile, 'up')
-            dosDown = getDOS(dosDownFile, rawFile, 'down')
-
-            # Correction to the Fermi level from the DOS data.
-            dataLen = len(dosDown)
-            truncated = []
-
-            for i in range(dataLen):
-                if math.fabs(dosDown[i][0]) < vincinity:
-                    truncated.append(dosDown[i])
-
-            correction = sorted(truncated, key=itemgetter(1))[0][0]
-
-            # Shift the whole dataset.
-            # for i in range(dataLen):
-            #     dosUp[i][0] += correction
-            #     dosDown[i][0] += correction
-
-            # Linearly interpolate the DOS data.
-            dosUpInterp = nmod.getInterp1d(dosUp)
-            dosDownInterp = nmod.getInterp1d(dosDown)
-
-            # Calculate the difference between the DOS at E-E_f = 0eV.
-            dosDiff = dosUpInterp(correction) - dosDownInterp(correction)
-            # dosDiff = dosDownInterp(0)
-            I_dos.append(dosDiff)
-            concentrations.append(dirname)
-
-            with open(outFile, 'a+') as f:
-                f.write(dirname + ' ' + str(dosDiff) + '\n')
-
-            # Calculate time left.
-            eachTimeTaken.append(time.time() - prevTime)
-            prevTime = time.time()
-            numDataLeft -= 1
-            sys.stdout.write('\r' + str(numDataLeft) + '/' + str(numData)
-                             + ' - Time left: ' + nmod.seconds2str(
-                             nmod.findMean(eachTimeTaken) * numDataLeft)
-                             + '         ')
-            sys.stdout.flush()
-
-        # Normalise the data and store as a new file.
-        normalised = nmod.normalise(I_dos)
-        print('\nNormalising DOS difference data...')
-        with open(normalisedFile, 'a+') as f:
-            for i in range(len(normalised)):
-                f.write(concentrations[i] + ' ' + str(normalised[i]) + '\n')
-
-        print('DOS difference analysis completed. Time taken: '
-               + nmod.seconds2str(time.time() - startTime))
+        self.run([('dosDiff', {'vincinity': vincinity, 'shift': shift})])
 
-    def fermiVelocity(self, dE):
+    def fermiVelocity(self, dE, numSlices=10):
         """ Fermi velocity analysis """
-        print('Running Fermi velocity analysis...')
-        concentrations = []
-        I_vf = []
-        normalised = []
-        outFile = os.path.join(self.analysisDir, 'fermi_velocity.txt')
-        normalisedFile = os.path.join(self.analysisDir,
-                                      'fermi_velocity_normalised.txt')
-
-        checkAnalysisFiles(outFile, normalisedFile)
-
-        # Define time variables for calculating time left.
-        numData = len(self.listDataDir)
-        numDataLeft = numData
-        startTime = time.time()
-        prevTime = startTime
-        eachTimeTaken = []
-
-        # Start the analysis process.
-        for dirname in self.listDataDir:
-            # Get the first and last 2D BSF data.
-            bsfDownFile = os.path.join(self.dataDir, dirname,
-                                        '1_bsf2d_down.txt')
-            rawFile = os.path.join(self.rawDir, dirname,
-                                   dirname + '_1_BLOCHSF_spol.bsf')
-            bsfDownStart = getBSF2D(bsfDownFile, rawFile, 'down', 5)
-
-            bsfDownFile = os.path.join(self.dataDir, dirname,
-                                        '10_bsf2d_down.txt')
-            rawFile = os.path.join(self.rawDir, dirname,
-                                   dirname + '_10_BLOCHSF_spol.bsf')
-            bsfDownEnd = getBSF2D(bsfDownFile, rawFile, 'down', 5)
-
-            # Get the ending position.
-            # First crop half of the data, to remove the other peak.
-            # Then get the position of the peak by finding the position of max.
-            truncated = []
-            for n in range(int(len(bsfDownEnd) / 2)):
-                truncated.append(bsfDownEnd[n])
-            index = truncated.index(max(truncated, key=itemgetter(1)))
-            kEnd = truncated[index][0]
-
-            # Get the starting position.
-            truncated = []
-            for n in range(int(len(bsfDownStart) / 2)):
-                truncated.append(bsfDownStart[n])
-            index = truncated.index(max(truncated, key=itemgetter(1)))
-            kStart = truncated[index][0]
-
-            # Calculate Fermi velocity.
-            dk = kEnd - kStart
-            vf = dE / dk
-            I_vf.append(vf)
-            concentrations.append(dirname)
-
-            with open(outFile, 'a+') as f:
-                f.write(dirname + ' ' + str(vf) + '\n')
-
-            # Calculate time left.
-            eachTimeTaken.append(time.time() - prevTime)
-            prevTime = time.time()
-            numDataLeft -= 1
-            sys.stdout.write('\r' + str(numDataLeft) + '/' + str(numData)
-                             + ' - Time left: ' + nmod.seconds2str(
-                             nmod.findMean(eachTimeTaken) * numDataLeft)
-                             + '         ')
-            sys.stdout.flush()
-
-        # Normalise the data and store as a new file.
-        normalised = nmod.normalise(I_vf)
-        print('\nNormalising Fermi velocity data...')
-        with open(normalisedFile, 'a+') as f:
-            for i in range(len(normalised)):
-                f.write(concentrations[i] + ' ' + str(normalised[i]) + '\n')
-
-        print('Fermi velocity analysis completed. Time taken: '
-               + nmod.seconds2str(time.time() - startTime))
+        self.run([('fermiVelocity', {'dE': dE, 'numSlices': numSlices})])
 
-    def meanFreePath(self):
+    def meanFreePath(self, mode='fit'):
         """ Mean free path analysis """
-        print('Running mean free path analysis...')
-        concentrations = []
-        I_mfp = []
-        normalised = []
-        outFile = os.path.join(self.analysisDir, 'mean_free_path.txt')
-        normalisedFile = os.path.join(self.analysisDir,
-                                      'mean_free_path_normalised.txt')
-
-        checkAnalysisFiles(outFile, normalisedFile)
-
-        # Define time variables for calculating time left.
-        numData = len(self.listDataDir)
-        numDataLeft = numData
-        startTime = time.time()
-        prevTime = startTime
-        eachTimeTaken = []
-
-        # Start the analysis process.
-        for dirname in self.listDataDir:
-            # Get the 2D BSF data at Fermi level.
-            bsfDownFile = os.path.join(self.dataDir, dirname,
-                                        '5_bsf2d_down.txt')
-            rawFile = os.path.join(self.rawDir, dirname,
-                                   dirname + '_5_BLOCHSF_spol.bsf')
-            bsfDown = getBSF2D(bsfDownFile, rawFile, 'down', 5)
-
-            # First crop half of the data to remove the other peak,
-            # then get the position of the peak by finding the position of max.
-            truncated = []
-            for n in range(int(len(bsfDown) / 2)):
-                truncated.append(bsfDown[n])
-            index = truncated.index(max(truncated, key=itemgetter(1)))
-
-            # Perform further cropping.
-            dataDel = int(2*index - len(truncated))
-            for n in range(dataDel):
-                del truncated[0]
-
-            nk = len(bsfDown)
-            peakY = max(truncated, key=itemgetter(1))[1]
-            peakX = truncated.index(peakY) / nk
-
-            # Calculate mean free path.
-            X = []
-            for x, _ in truncated:
-                X.append(x)
-            popt, _ = curve_fit(lorentzian(peakX, peakY),
-                                X, truncated, maxfev=1000)
-            mfp = 1 / popt[0]
-            I_mfp.append(mfp)
-            concentrations.append(dirname)
-
-            with open(outFile, 'a+') as f:
-                f.write(dirname + ' ' + str(mfp) + '\n')
-
-            # Calculate time left.
-            eachTimeTaken.append(time.time() - prevTime)
-            prevTime = time.time()
-            numDataLeft -= 1
-            sys.stdout.write('\r' + str(numDataLeft) + '/' + str(numData)
-                             + ' - Time left: ' + nmod.seconds2str(
-                             nmod.findMean(eachTimeTaken) * numDataLeft)
-                             + '         ')
-            sys.stdout.flush()
-
-        # Normalise the data and store as a new file.
-        normalised = nmod.normalise(I_mfp)
-        print('\nNormalising mean free path data...')
-        with open(normalisedFile, 'a+') as f:
-            for i in range(len(normalised)):
-                f.write(concentrations[i] + ' ' + str(normalised[i]) + '\n')
-
-        print('Mean free path analysis completed. Time taken: '
-               + nmod.seconds2str(time.time() - startTime))
+        self.run([('meanFreePath', {'mode': mode})])
@@ -0,0 +1,68 @@
+""" Per-metric result cache for incremental analysis """
+import os
+import json
+import hashlib
+
+def fileStamp(filePath, hashContent=False):
+    """ Return a string that changes whenever the file changes """
+    if hashContent:
+        sha = hashlib.sha1()
+        with open(filePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    stat = os.stat(filePath)
+    return str(stat.st_size) + ':' + str(stat.st_mtime_ns)
+
+def resultKey(filePaths, params, hashContent=False):
+    """
+    Return the cache key of a compound result from its input files
+    and the metric parameters.
+    """
+    sha = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+
+    for filePath in filePaths:
+        sha.update(filePath.encode())
+        sha.update(fileStamp(filePath, hashContent).encode())
+
+    return sha.hexdigest()
+
+class ResultCache(object):
+    """ Results of a single metric keyed by compound directory name """
+    def __init__(self, cacheDir, fileName):
+        self.cacheFile = os.path.join(cacheDir, fileName + '.json')
+        self.entries = {}
+
+        if os.path.isfile(self.cacheFile):
+            try:
+                with open(self.cacheFile) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print('Ignoring corrupted cache ' + self.cacheFile + '.')
+                self.entries = {}
+
+    def get(self, dirname, key):
+        """ Return the cached result, or None if it is missing or stale """
+        entry = self.entries.get(dirname)
+
+        if entry is None or entry['key'] != key:
+            return None
+
+        return entry['result']
+
+    def set(self, dirname, key, result):
+        """ Store a result """
+        self.entries[dirname] = {'key': key, 'result': result}
+
+    def save(self):
+        """ Write the cache to disk """
+        cacheDir = os.path.dirname(self.cacheFile)
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+        tmpFile = self.cacheFile + '.tmp'
+        with open(tmpFile, 'w') as f:
+            json.dump(self.entries, f)
+
+        os.replace(tmpFile, self.cacheFile)
@@ -2,6 +2,8 @@
 import os
 import sys
 import inspect
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
 # Add extra libraries' directories to import list
 baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
@@ -10,6 +12,16 @@ sys.path.append(baseLibDir)
 
 # Import own libraries
 import nmod
+from template import loadTemplate, loadElements
+from grid import concentrationGrid, concentrationNames, \
+    concentrationPrecision
+from timing import Progress
+from refine import refineResults
+from warmstart import finishedPotentials, seedPotential
+
+def createCompound(compound, fullConc, settings):
+    """ Create a single compound, used by the process pool """
+    return compound.create(fullConc, verbose=False, **settings)
 
 class Compound(object):
     """ Compound base class """
@@ -18,7 +30,8 @@ class Compound(object):
         baseDir = os.path.join(os.path.dirname(os.path.realpath(
             inspect.getfile(inspect.currentframe()))), '..', '..')
         self.templatesDir = os.path.join(baseDir, 'templates')
-        self.jobsDir = os.path.join(baseDir, jobsDir, 'jobs', 'new')
+        self.mainDir = os.path.join(baseDir, jobsDir)
+        self.jobsDir = os.path.join(self.mainDir, 'jobs', 'new')
 
         # Initialise the require information and settings.
         self.elements = elements.split()
@@ -44,83 +57,178 @@ class Compound(object):
 
         if error:
             nmod.nexit()
-        else:
-            os.chdir(self.jobsDir)
 
-    def create(self, fullConc, **kwargs):
-        """ Create the specified compound """
-        elementsFile = os.path.join(self.templatesDir, 'elements.txt')
+        # Read the templates and the elements table once.
+        self.potTemplate = loadTemplate(self.potPath)
+        self.scfTemplate = loadTemplate(os.path.join(self.templatesDir,
+                                                     'scf.inp'))
+        elementsTable = loadElements(os.path.join(self.templatesDir,
+                                                  'elements.txt'))
+        self.IT = []
+        self.finished = None # Finished compounds, read on warm starts.
+
+        for element in self.elements:
+            if element not in elementsTable:
+                print(element + ' is not in '
+                      + os.path.join(self.templatesDir, 'elements.txt') + '.')
+                nmod.nexit()
+            self.IT.append(elementsTable[element])
+
+        os.chdir(self.jobsDir)
 
+    def create(self, fullConc, verbose=True, **kwargs):
+        """
+        Create the specified compound.
+        Return whether it was created, it is not if it already exists.
+        """
         # Set default settings.
         settings = {
             'mode'  : 'REL',
             'nktab' : '250',
-            'NE'    : '30'
+            'NE'    : '30',
+            'warmStart'  : False,
+            'maxDistance': None
         }
 
         # Replace default settings with user defined settings.
-        for key, value in kwargs.iteritems():
+        for key, value in kwargs.items():
             settings[key] = value
 
-        # Set the different concentrations
-        concentrations = fullConc.split('_')
-        conc = [None]*5
-        for i in range(len(concentrations)):
-            conc[i] = concentrations[i]
-
-        # Set the different elements
-        IT = [None]*5
-        for i in range(len(self.elements)):
-            IT[i] = nmod.findLine(elementsFile, self.elements[i])
-
-        fullname = (
-            self.elements[0] + conc[0]
-            + self.elements[1] + conc[1]
-            + self.elements[2] + conc[2]
-            + self.elements[3] + conc[3]
-            + self.elements[4] + conc[4]
-        )
+        # Set the different concentrations and elements.
+        numElements = max(len(self.elements), 5)
+        conc = (fullConc.split('_') + [None]*numElements)[:numElements]
+        IT = (self.IT + [None]*numElements)[:numElements]
+
+        fullname = ''.join([element + c for element, c
+                            in zip(self.elements, conc)])
+        compoundDir = os.path.join(self.jobsDir, fullConc)
 
         # Check if directory already exists, if not, carry on.
-        if os.path.isdir(fullConc):
-            print(fullConc + ' already exists, it will not be overwritten.')
-        else:
-            os.makedirs(fullConc)
-
-            # Start the creation process.
-            # Take all the template files, copy it to the new directory
-            # and replace the "tmp" strings with the settings.
-
-            # POT
-            reps = {
-                'tmpSYSTEM' : fullname,
-                'tmpALAT'   : self.alat,
-                'tmpCONC1'  : conc[0],
-                'tmpCONC2'  : conc[1],
-                'tmpCONC3'  : conc[2],
-                'tmpCONC4'  : conc[3],
-                'tmpCONC5'  : conc[4],
-                'tmpIT1'    : IT[0],
-                'tmpIT2'    : IT[1],
-                'tmpIT3'    : IT[2],
-                'tmpIT4'    : IT[3],
-                'tmpIT5'    : IT[4]
-            }
-            nmod.modFile(os.path.join(fullConc, 'pot.pot'),
-                os.path.join(self.templatesDir, self.potFile + '.pot'), reps)
-
-            # SCF
-            reps = {
-                'tmpDATASET' : fullname,
-                'tmpMODE'    : settings['mode'],
-                'tmpNKTAB'   : settings['nktab'],
-                'tmpNE'      : settings['NE']
-            }
-            nmod.modFile(os.path.join(fullConc, 'scf.inp'),
-                os.path.join(self.templatesDir, 'scf.inp'), reps)
+        if os.path.isdir(compoundDir):
+            if verbose:
+                print(fullConc + ' already exists, '
+                      + 'it will not be overwritten.')
+            return False
+
+        os.makedirs(compoundDir)
 
+        # Start the creation process.
+        # Take all the template files, copy it to the new directory
+        # and replace the "tmp" strings with the settings.
+
+        # POT
+        reps = {
+            'tmpSYSTEM' : fullname,
+            'tmpALAT'   : self.alat
+        }
+        for i in range(numElements):
+            reps['tmpCONC' + str(i+1)] = conc[i]
+            reps['tmpIT' + str(i+1)] = IT[i]
+        self.potTemplate.write(os.path.join(compoundDir, 'pot.pot'), reps)
+
+        # Start from the converged potential of the nearest finished compound.
+        if settings['warmStart']:
+            if self.finished is None:
+                self.finished = finishedPotentials(os.path.join(self.mainDir,
+                                                                'raw'))
+            seedPotential(compoundDir, self.finished, settings['maxDistance'])
+
+        # SCF
+        reps = {
+            'tmpDATASET' : fullname,
+            'tmpMODE'    : settings['mode'],
+            'tmpNKTAB'   : settings['nktab'],
+            'tmpNE'      : settings['NE']
+        }
+        self.scfTemplate.write(os.path.join(compoundDir, 'scf.inp'), reps)
+
+        if verbose:
             print(fullname + " has been created.")
 
+        return True
+
+    def createMany(self, concentrations, workers=1, **kwargs):
+        """
+        Create all the compounds of a list of concentrations,
+        in a process pool if more than one worker is requested.
+        """
+        numData = len(concentrations)
+        progress = Progress(numData)
+        numCreated = 0
+
+        # Read the finished compounds once rather than in every worker.
+        if kwargs.get('warmStart'):
+            self.finished = finishedPotentials(os.path.join(self.mainDir,
+                                                            'raw'))
+
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            chunksize = max(1, int(numData / (workers * 4)))
+            createdIter = executor.map(createCompound, [self] * numData,
+                                       concentrations, [kwargs] * numData,
+                                       chunksize=chunksize)
+        else:
+            executor = None
+            createdIter = map(createCompound, [self] * numData,
+                              concentrations, [kwargs] * numData)
+
+        try:
+            for created in createdIter:
+                numCreated += created
+                progress.update()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        print('')
+        print(str(numCreated) + ' compounds have been created, '
+              + str(numData - numCreated) + ' already existed.')
+
+    def createGrid(self, groups, num, sampling='grid', numSamples=None,
+                   bounds=None, seed=0, workers=1, **kwargs):
+        """
+        Create the compounds of a concentration grid, see
+        grid.concentrationGrid for the groups, sampling modes and bounds.
+        Return the names of the compounds.
+        """
+        points = concentrationGrid(groups, num, sampling, numSamples,
+                                   bounds, seed)
+
+        # Name the samples with the precision of the whole grid.
+        names = concentrationNames(points, concentrationPrecision(
+            np.array([total * np.arange(num) / (num - 1)
+                      for _, total in groups])))
+        print('Creating ' + str(len(names)) + ' compounds...')
+        self.createMany(names, workers, **kwargs)
+
+        return names
+
+    def refine(self, metrics=('band_gap', 'dos_diff'), thresholds=None,
+               fraction=0.1, maxPoints=None, workers=1, **kwargs):
+        """
+        Create the compounds of the next adaptive refinement round, halfway
+        between finished compounds where the normalised metrics change the
+        fastest or cross their thresholds, see refine.refinePoints.
+        Return the names of the compounds.
+        """
+        points = refineResults(self.mainDir, metrics, thresholds, fraction,
+                               maxPoints)
+
+        if len(points) == 0:
+            print('There is nothing left to refine.')
+            return []
+
+        names = concentrationNames(points)
+        print('Refining with ' + str(len(names)) + ' compounds...')
+        self.createMany(names, workers, **kwargs)
+
+        return names
+
+    def compoundDirs(self):
+        """ Return all the compound directories created """
+        return sorted([dirname for dirname in os.listdir(self.jobsDir)
+                       if os.path.isdir(os.path.join(self.jobsDir, dirname))])
+
     def generateDOS(self, **kwargs):
         """ Generate DOS input files for all the compounds created """
         # Set default settings.
@@ -134,14 +242,16 @@ class Compound(object):
         }
 
         # Replace default settings with user defined settings.
-        for key, value in kwargs.iteritems():
+        for key, value in kwargs.items():
             settings[key] = value
 
         print('Generating DOS input files.')
+        template = loadTemplate(os.path.join(self.templatesDir, 'dos.inp'))
+
+        for dirname in self.compoundDirs():
+            dosFile = os.path.join(self.jobsDir, dirname, 'dos.inp')
 
-        for dirname in os.listdir('.'):
-            if (os.path.exists(os.path.join(dirname, 'dos.inp'))
-                    is True):
+            if os.path.exists(dosFile) is True:
                 print(dirname + ' already contains dos.inp, '
                       + 'it will not be overwritten.')
             else:
@@ -154,8 +264,7 @@ class Compound(object):
                     'tmpEMAX'    : settings['EMAX'],
                     'tmpImE'     : settings['ImE']
                 }
-                nmod.modFile(os.path.join(dirname, 'dos.inp'),
-                    os.path.join(self.templatesDir, 'dos.inp'), reps)
+                template.write(dosFile, reps)
 
         print('Finish generating DOS input files.')
 
@@ -175,15 +284,17 @@ class Compound(object):
         }
 
         # Replace default settings with user defined settings.
-        for key, value in kwargs.iteritems():
+        for key, value in kwargs.items():
             settings[key] = value
 
         print('Generating BSF input files.')
+        template = loadTemplate(os.path.join(self.templatesDir, 'bsf.inp'))
 
-        for dirname in os.listdir('.'):
+        for dirname in self.compoundDirs():
             if settings['iterations'] == 0:
-                if (os.path.exists(os.path.join(dirname, 'bsf.inp'))
-                        is True):
+                bsfFile = os.path.join(self.jobsDir, dirname, 'bsf.inp')
+
+                if os.path.exists(bsfFile) is True:
                     print(dirname + ' already contains bsf.inp, '
                           + 'it will not be overwritten.')
                 else:
@@ -194,22 +305,22 @@ class Compound(object):
                         'tmpEMIN'    : settings['EMIN'],
                         'tmpEMAX'    : settings['EMAX'],
                         'tmpNK1'     : settings['NK1'],
-                        'tmpNK2'     : settings['NK1'],
+                        'tmpNK2'     : settings['NK2'],
                         'tmpK1'      : settings['K1'],
                         'tmpK2'      : settings['K2']
                     }
-                    nmod.modFile(os.path.join(dirname, 'bsf.inp'),
-                         os.path.join(self.templatesDir, 'bsf.inp'), reps)
+                    template.write(bsfFile, reps)
             else:
                 energy = (settings['EMIN'] - 0.5*float(settings['eRange']))
 
                 for i in range(settings['iterations']):
                     tmpnum = str(i + 1)
-                    bsfFile = 'bsf_' + tmpnum + '.inp'
+                    bsfFile = os.path.join(self.jobsDir, dirname,
+                                           'bsf_' + tmpnum + '.inp')
 
-                    if (os.path.exists(os.path.join(dirname, bsfFile))
-                            is True):
-                        print(dirname + ' already contains ' + bsfFile + ', '
+                    if os.path.exists(bsfFile) is True:
+                        print(dirname + ' already contains '
+                              + os.path.basename(bsfFile) + ', '
                               + 'it will not be overwritten.')
                     else:
                         energy += settings['eRange'] / settings['iterations']
@@ -220,11 +331,10 @@ class Compound(object):
                             'tmpEMIN'    : energy,
                             'tmpEMAX'    : energy,
                             'tmpNK1'     : settings['NK1'],
-                            'tmpNK2'     : settings['NK1'],
+                            'tmpNK2'     : settings['NK2'],
                             'tmpK1'      : settings['K1'],
                             'tmpK2'      : settings['K2']
                         }
-                        nmod.modFile(os.path.join(dirname, bsfFile),
-                             os.path.join(self.templatesDir, 'bsf.inp'), reps)
+                        template.write(bsfFile, reps)
 
         print('Finish generating BSF input files.')
@@ -9,50 +9,32 @@ sys.path.append(baseLibDir)
 import nmod
 from compound import Compound
 
+# Elements sharing each site and their total occupation for every
+# potential, the first element fills its own site.
+GROUPS = {
+    'sc_5_elements_b2': [([0], 1.0), ([1, 2], 0.5), ([3, 4], 0.5)],
+    'fcc_5_elements_l21': [([0], 1.0), ([1, 2], 1.0), ([3, 4], 1.0)]
+}
+
 class FiveElements(Compound):
     """ Five elements compound child class """
     def __init__(self, jobsDir, elements, potFile, alat):
         numElements = len(elements.split())
 
         if numElements != 5:
-            print('Expecting 5 elements, but ' + numElements
+            print('Expecting 5 elements, but ' + str(numElements)
                   + ' (' + elements + ') were inputted.')
             nmod.nexit()
 
         Compound.__init__(self, jobsDir, elements, potFile, alat)
 
-    def generateConcentrations(self, num, **kwargs):
-        """ Generate the required permutations of concentrations """
-        if self.potFile == 'sc_5_elements_b2':
-            a, b, c, d, e = 1.0, 0.5, 0.0, 0.5, 0.0
-            step = b / (num - 1)
-            precision = len(str(step).split('.')[1])
-            conc = [None]*5
-            conc[0] = nmod.float2str(precision, a)
-            
-            for i in range(0, num * num):
-                x, y = i % num, int(i / num)
-                conc[1] = nmod.float2str(precision, b - x * step)
-                conc[2] = nmod.float2str(precision, c + x * step)
-                conc[3] = nmod.float2str(precision, d - y * step)
-                conc[4] = nmod.float2str(precision, e + y * step)
-                self.create(conc[0] + '_' + conc[1] + '_' + conc[2]
-                            + '_' + conc[3] + '_' + conc[4], **kwargs)
-        elif self.potFile == 'fcc_5_elements_l21':
-            a, b, c, d, e = 1.0, 1.0, 0.0, 1.0, 0.0
-            step = b / (num - 1)
-            precision = len(str(step).split('.')[1])
-            conc = [None]*5
-            conc[0] = nmod.float2str(precision, a)
-            
-            for i in range(0, num * num):
-                x, y = i % num, int(i / num)
-                conc[1] = nmod.float2str(precision, b - x * step)
-                conc[2] = nmod.float2str(precision, c + x * step)
-                conc[3] = nmod.float2str(precision, d - y * step)
-                conc[4] = nmod.float2str(precision, e + y * step)
-                self.create(conc[0] + '_' + conc[1] + '_' + conc[2]
-                            + '_' + conc[3] + '_' + conc[4], **kwargs)
-        else:
+    def generateConcentrations(self, num, workers=1, **kwargs):
+        """
+        Generate the required permutations of concentrations,
+        creating the compounds with the given number of workers.
+        """
+        if self.potFile not in GROUPS:
             print(self.potFile + ' has not yet been implemented.')
             nmod.nexit()
+
+        self.createGrid(GROUPS[self.potFile], num, workers=workers, **kwargs)
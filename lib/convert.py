@@ -0,0 +1,135 @@
+""" Convert raw SPR-KKR output into the data folder """
+import os
+import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Import own libraries
+import nmod
+
+def rawBSFFiles(rawDir, dirname):
+    """ Return all the spin polarised BSF files of a raw compound """
+    return sorted(glob.glob(os.path.join(rawDir, dirname,
+                                         '*_BLOCHSF_spol.bsf')))
+
+def isUpToDate(rawFile, outFiles):
+    """ Check if all the converted files exist and are newer than rawFile """
+    rawTime = os.path.getmtime(rawFile)
+
+    for outFile in outFiles:
+        cacheFile = nmod.cachePath(outFile)
+        if (os.path.isfile(outFile) is False
+                or os.path.isfile(cacheFile) is False
+                or os.path.getmtime(cacheFile) < rawTime):
+            return False
+
+    return True
+
+def convertCompound(rawDir, dataDir, dirname, bsfSpins=('down',),
+                    force=False):
+    """
+    Convert the DOS and every BSF slice of a raw compound straight into
+    the data folder, skipping the files that are already up to date.
+    Return a list of (raw file, size in bytes, seconds taken) of every
+    converted file.
+    """
+    outDir = os.path.join(dataDir, dirname)
+    converted = []
+
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir, exist_ok=True)
+
+    dosFile = os.path.join(rawDir, dirname, 'dos.agr')
+
+    if os.path.isfile(dosFile):
+        outFiles = [os.path.join(outDir, 'dos_' + spin + '.txt')
+                    for spin in ['up', 'down']]
+
+        if force or not isUpToDate(dosFile, outFiles):
+            startTime = time.time()
+            nmod.getDOSSpins(dosFile, outDir=outDir)
+            converted.append((dosFile, os.path.getsize(dosFile),
+                              time.time() - startTime))
+
+    for bsfFile in rawBSFFiles(rawDir, dirname):
+        outFiles = [nmod.bsfOutFile(bsfFile, 'bsf2d', spin, outDir)
+                    for spin in bsfSpins]
+
+        if force or not isUpToDate(bsfFile, outFiles):
+            startTime = time.time()
+            for spin in bsfSpins:
+                nmod.getBSF2D(bsfFile, spin, 5, outDir=outDir)
+            converted.append((bsfFile, os.path.getsize(bsfFile),
+                              time.time() - startTime))
+
+    return converted
+
+def convertAll(mainDir, workers=1, bsfSpins=('down',), force=False):
+    """
+    Convert every compound of mainDir/raw into mainDir/data,
+    in a process pool if more than one worker is requested.
+    """
+    rawDir = os.path.join(mainDir, 'raw')
+    dataDir = os.path.join(mainDir, 'data')
+
+    if os.path.isdir(rawDir) is False:
+        print('The directory provided does not have a raw folder.')
+        nmod.nexit()
+
+    dirnames = sorted([dirname for dirname in os.listdir(rawDir)
+                       if os.path.isdir(os.path.join(rawDir, dirname))])
+    numData = len(dirnames)
+    numDataLeft = numData
+    converted = []
+    startTime = time.time()
+
+    print('Converting ' + str(numData) + ' compounds in ' + rawDir + '...')
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        resultsIter = executor.map(convertCompound, [rawDir] * numData,
+                                   [dataDir] * numData, dirnames,
+                                   [bsfSpins] * numData, [force] * numData)
+    else:
+        executor = None
+        resultsIter = map(convertCompound, [rawDir] * numData,
+                          [dataDir] * numData, dirnames,
+                          [bsfSpins] * numData, [force] * numData)
+
+    try:
+        for result in resultsIter:
+            converted += result
+            numDataLeft -= 1
+            sys.stdout.write('\r' + str(numDataLeft) + '/' + str(numData)
+                             + ' compounds left         ')
+            sys.stdout.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    timeTaken = time.time() - startTime
+    print('')
+
+    if len(converted) == 0:
+        print('All compounds are already up to date.')
+        return converted
+
+    # Report the throughput per file and overall.
+    numBytes = sum([size for _, size, _ in converted])
+    fileTime = sum([seconds for _, _, seconds in converted])
+    slowest = max(converted, key=lambda c: c[2])
+    print(nmod.ntabulate([
+        ['files converted', len(converted)],
+        ['MB converted', '{:.2f}'.format(numBytes / 1e6)],
+        ['mean time per file', '{:.4f}s'.format(fileTime / len(converted))],
+        ['MB/s per file', '{:.2f}'.format(numBytes / 1e6 / fileTime)
+         if fileTime > 0 else '-'],
+        ['MB/s overall', '{:.2f}'.format(numBytes / 1e6 / timeTaken)
+         if timeTaken > 0 else '-'],
+        ['slowest file', os.path.relpath(slowest[0], rawDir)
+         + ' ({:.4f}s)'.format(slowest[2])]
+    ]))
+    print('Conversion completed. Time taken: ' + nmod.seconds2str(timeTaken))
+
+    return converted
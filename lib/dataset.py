@@ -0,0 +1,132 @@
+""" Consolidated DOS dataset over the whole concentration grid """
+import os
+import numpy as np
+
+# Import own libraries
+from analysis import CompoundData, cumulativeIntegral
+
+DATASET_ARRAYS = ['concentrations', 'energies', 'dos_up', 'dos_down']
+
+def parseConcentrations(dirnames):
+    """
+    Return the (ncompounds, nelements) concentrations array of
+    directory names such as 1.000_0.475_0.025_0.500_0.000.
+    """
+    return np.array([[float(c) for c in dirname.split('_')]
+                     for dirname in dirnames], dtype=np.float64)
+
+def commonGrid(grids):
+    """
+    Return the energy grid shared by all the compounds, or a uniform grid
+    over the energy range covered by all of them if the grids differ.
+    """
+    first = grids[0]
+
+    if all(len(grid) == len(first) and np.array_equal(grid, first)
+           for grid in grids):
+        return np.array(first)
+
+    emin = max(grid[0] for grid in grids)
+    emax = min(grid[-1] for grid in grids)
+    numPoints = max(len(grid) for grid in grids)
+
+    return np.linspace(emin, emax, numPoints)
+
+def buildDataset(analysis, outDir=None):
+    """
+    Stack the DOS of every compound of an analysis onto a common energy
+    grid and store it, with the concentrations and the compound names,
+    in mainDir/dataset/dataset.npz.
+    Return the dataset as a dictionary of arrays.
+    """
+    if outDir is None:
+        outDir = os.path.join(analysis.mainDir, 'dataset')
+
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+
+    dirnames = analysis.listDataDir
+    dos = {'up': [], 'down': []}
+
+    for dirname in dirnames:
+        data = CompoundData(analysis.dataDir, analysis.rawDir, dirname)
+        for spin in dos:
+            dos[spin].append(data.dos(spin))
+
+    energies = commonGrid([d[:, 0] for d in dos['up'] + dos['down']])
+    dataset = {
+        'concentrations': parseConcentrations(dirnames),
+        'energies': energies
+    }
+
+    for spin in dos:
+        stacked = np.empty((len(dirnames), len(energies)))
+        for n, d in enumerate(dos[spin]):
+            if len(d) == len(energies) and np.array_equal(d[:, 0], energies):
+                stacked[n] = d[:, 1]
+            else:
+                stacked[n] = np.interp(energies, d[:, 0], d[:, 1])
+        dataset['dos_' + spin] = stacked
+
+    dataset['names'] = list(dirnames)
+    saveDataset(os.path.join(outDir, 'dataset.npz'), dataset)
+
+    return dataset
+
+def saveDataset(filePath, dataset):
+    """ Store a dataset in a single .npz file, replacing it atomically """
+    tmpFile = filePath + '.tmp'
+
+    with open(tmpFile, 'wb') as f:
+        np.savez(f, names=np.array(dataset['names'], dtype=str),
+                 **dict([(name, np.asarray(dataset[name], dtype=np.float64))
+                         for name in DATASET_ARRAYS]))
+
+    os.replace(tmpFile, filePath)
+
+def loadDataset(mainDir):
+    """
+    Load a dataset created by buildDataset.
+    Return None if it does not exist.
+    """
+    datasetFile = os.path.join(mainDir, 'dataset', 'dataset.npz')
+
+    if os.path.isfile(datasetFile) is False:
+        return None
+
+    with np.load(datasetFile) as f:
+        dataset = dict([(name, f[name]) for name in DATASET_ARRAYS])
+        dataset['names'] = f['names'].tolist()
+
+    return dataset
+
+def toGrid(concentrations, values, xColumn=2, yColumn=4):
+    """
+    Arrange the values of every compound onto a 2D grid over two of the
+    concentration columns, e.g. for heatmaps of the 21x21 grids.
+    Return the x and y concentrations and the (ny, nx) grid,
+    with NaN for missing compounds.
+    """
+    xs, xIndex = np.unique(np.round(concentrations[:, xColumn], 8),
+                           return_inverse=True)
+    ys, yIndex = np.unique(np.round(concentrations[:, yColumn], 8),
+                           return_inverse=True)
+    grid = np.full((len(ys), len(xs)), np.nan)
+    grid[yIndex, xIndex] = values
+
+    return xs, ys, grid
+
+def bandGaps(dataset, aInit, stripSize, stepSize):
+    """
+    Minimum spin down DOS integral of every compound, as in the band gap
+    analysis, computed for the whole dataset at once.
+    """
+    iterations = int(abs(aInit) / stepSize) + 1
+    energies = np.asarray(dataset['energies'])
+    dos = np.asarray(dataset['dos_down'])
+    a = aInit + np.arange(iterations) * stepSize
+
+    integrals = (cumulativeIntegral(energies, dos, a + stripSize)
+                 - cumulativeIntegral(energies, dos, a))
+
+    return integrals.min(axis=1)
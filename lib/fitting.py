@@ -0,0 +1,138 @@
+""" Batched Lorentzian peak fitting """
+import numpy as np
+
+def lorentzian(x, x0, width, I):
+    """ Lorentzian with 1 peak of height I and half width at half maximum """
+    width2 = width * width
+    return I * width2 / ((x - x0)*(x - x0) + width2)
+
+def stack(peaks):
+    """
+    Stack a list of (x, y) arrays of different lengths into padded
+    (npeaks, npoints) arrays, with a mask of the valid points.
+    """
+    numPoints = max(len(x) for x, _ in peaks)
+    X = np.zeros((len(peaks), numPoints))
+    Y = np.zeros((len(peaks), numPoints))
+    mask = np.zeros((len(peaks), numPoints), dtype=bool)
+
+    for n, (x, y) in enumerate(peaks):
+        X[n, :len(x)] = x
+        Y[n, :len(y)] = y
+        mask[n, :len(x)] = True
+
+    # Repeat the last valid point so that padding never looks like a peak.
+    last = mask.sum(axis=1) - 1
+    rows = np.arange(len(peaks))
+    X = np.where(mask, X, X[rows, last][:, None])
+    Y = np.where(mask, Y, Y[rows, last][:, None])
+
+    return X, Y, mask
+
+def halfWidths(X, Y, mask):
+    """
+    Closed-form estimate of the peak position, half width at half maximum
+    and height of every row of stacked peaks, found by linearly
+    interpolating where each side of the peak crosses half its maximum.
+    """
+    rows = np.arange(len(X))
+    Ymasked = np.where(mask, Y, -np.inf)
+    peak = np.argmax(Ymasked, axis=1)
+    height = Y[rows, peak]
+    half = 0.5 * height
+    above = Ymasked >= half[:, None]
+    cols = np.arange(X.shape[1])
+
+    # Last point below half maximum before the peak and first after it.
+    left = np.where(~above & (cols <= peak[:, None]), cols, -1).max(axis=1)
+    right = np.where(~above & (cols >= peak[:, None]) & mask, cols,
+                     X.shape[1]).min(axis=1)
+
+    def crossing(below, inside):
+        """ Interpolated position of the half maximum between two points """
+        below = np.clip(below, 0, X.shape[1] - 1)
+        x0, x1 = X[rows, below], X[rows, inside]
+        y0, y1 = Y[rows, below], Y[rows, inside]
+        t = np.where(y1 != y0, (half - y0) / np.where(y1 != y0, y1 - y0, 1),
+                     0.0)
+        return x0 + t * (x1 - x0)
+
+    leftX = np.where(left >= 0, crossing(left, np.minimum(left + 1, peak)),
+                     X[rows, 0])
+    right = np.where(right < X.shape[1], right, mask.sum(axis=1) - 1)
+    rightX = crossing(right, np.maximum(right - 1, peak))
+
+    # One sided estimates are used when a side never drops below half.
+    leftWidth = X[rows, peak] - leftX
+    rightWidth = rightX - X[rows, peak]
+    width = np.where(left >= 0, leftWidth, rightWidth)
+    width = np.where((left >= 0) & (rightWidth > 0),
+                     0.5 * (leftWidth + rightWidth), width)
+
+    return X[rows, peak], np.abs(width), height
+
+def fitLorentzians(X, Y, mask, p0, maxIter=200, tol=1e-10):
+    """
+    Fit a Lorentzian to every row of stacked peaks at once with the
+    Levenberg-Marquardt algorithm and an analytic Jacobian.
+    p0 holds the initial (x0, width, I) of each row.
+    Return the parameters, the root mean square residual of each fit
+    and whether each fit converged within maxIter iterations.
+    """
+    params = np.array(p0, dtype=float)
+    weights = mask.astype(float)
+    numPoints = weights.sum(axis=1)
+    damping = np.full(len(X), 1e-3)
+    converged = np.zeros(len(X), dtype=bool)
+
+    def residuals(p):
+        """ Masked residuals of every row """
+        model = lorentzian(X, p[:, 0:1], p[:, 1:2], p[:, 2:3])
+        return (model - Y) * weights
+
+    r = residuals(params)
+    cost = (r * r).sum(axis=1)
+
+    for _ in range(maxIter):
+        x0, width, I = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+        dx = X - x0
+        denom = dx*dx + width*width
+        shape = width*width / denom
+
+        # Derivatives of the model with respect to x0, width and I.
+        J = np.stack([I * shape * 2*dx / denom,
+                      I * 2*width * dx*dx / (denom*denom),
+                      shape], axis=2) * weights[:, :, None]
+        JTJ = np.einsum('nki,nkj->nij', J, J)
+        JTr = np.einsum('nki,nk->ni', J, r)
+
+        # Solve the damped normal equations of every row at once.
+        diag = np.einsum('nii->ni', JTJ)
+        A = JTJ + (damping[:, None] * np.maximum(diag, 1e-12))[:, :, None] \
+            * np.eye(3)
+        step = -np.linalg.solve(A, JTr[:, :, None])[:, :, 0]
+
+        trial = params + step
+        rTrial = residuals(trial)
+        costTrial = (rTrial * rTrial).sum(axis=1)
+        better = (costTrial < cost) & ~converged & np.isfinite(costTrial)
+
+        # Converged rows stop moving once the cost no longer decreases.
+        improvement = np.where(better, cost - costTrial, 0.0)
+        converged |= better & (improvement <= tol * np.maximum(cost, 1e-300))
+        converged |= ~better & (np.abs(step).max(axis=1)
+                                <= tol * np.abs(params).max(axis=1))
+
+        params = np.where(better[:, None], trial, params)
+        r = np.where(better[:, None], rTrial, r)
+        cost = np.where(better, costTrial, cost)
+        damping = np.where(better, damping * 0.1, damping * 10.0)
+        damping = np.clip(damping, 1e-12, 1e12)
+
+        if converged.all():
+            break
+
+    params[:, 1] = np.abs(params[:, 1])
+    rms = np.sqrt(cost / np.maximum(numPoints, 1))
+
+    return params, rms, converged
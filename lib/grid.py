@@ -0,0 +1,159 @@
+""" Concentration grids of compounds with any number of elements """
+import numpy as np
+
+# scipy is optional, only the Latin hypercube and Sobol samples need it.
+try:
+    from scipy.stats import qmc
+except ImportError:
+    qmc = None
+
+# Import own libraries
+import nmod
+
+SAMPLINGS = ['grid', 'lhs', 'sobol']
+
+def simplexLattice(numElements, num, total=1.0):
+    """
+    Return every concentration of numElements elements sharing a site with
+    the given total occupation, in num - 1 equal steps of total / (num - 1),
+    as a (npoints, numElements) array. The first element starts at total
+    and decreases the fastest, e.g. (0.5, 0), (0.475, 0.025), ...
+    """
+    if numElements == 1:
+        return np.array([[float(total)]])
+
+    m = num - 1
+    counts = np.indices((num,) * (numElements - 1)).reshape(
+        numElements - 1, -1)[::-1].T
+    counts = counts[counts.sum(axis=1) <= m]
+    counts = np.column_stack((m - counts.sum(axis=1), counts))
+
+    return counts * (total / m)
+
+def productGrid(lattices):
+    """
+    Return every combination of the rows of several lattices, with the
+    rows of the first lattice varying the fastest.
+    """
+    index = np.indices([len(lattice) for lattice in lattices[::-1]]).reshape(
+        len(lattices), -1)[::-1]
+
+    return np.column_stack([lattice[i] for lattice, i in zip(lattices, index)])
+
+def sampleGrid(lattices, numSamples, sampling, seed=0):
+    """
+    Return a Latin hypercube or Sobol subset of numSamples points of the
+    product of the lattices, snapping quasi-random points in the unit
+    cube onto the nearest row of each lattice.
+    """
+    if qmc is None:
+        print('scipy is required for ' + sampling + ' sampling.')
+        nmod.nexit()
+
+    # Every lattice with more than one row gets a sampling dimension.
+    varying = [i for i, lattice in enumerate(lattices) if len(lattice) > 1]
+    dimensions = sum([lattices[i].shape[1] - 1 for i in varying])
+
+    if sampling == 'lhs':
+        sampler = qmc.LatinHypercube(d=dimensions, seed=seed)
+    else:
+        sampler = qmc.Sobol(d=dimensions, scramble=True, seed=seed)
+
+    unit = sampler.random(numSamples)
+    columns = []
+    d = 0
+
+    for i, lattice in enumerate(lattices):
+        if i not in varying:
+            columns.append(np.repeat(lattice, numSamples, axis=0))
+            continue
+
+        # Map the unit cube onto the simplex by sorted spacings,
+        # then pick the nearest concentration of the lattice.
+        k = lattice.shape[1]
+        breaks = np.sort(unit[:, d:d + k - 1], axis=1)
+        d += k - 1
+        parts = np.diff(np.column_stack((np.zeros(numSamples), breaks,
+                                         np.ones(numSamples))), axis=1)
+        parts = parts * lattice.sum(axis=1)[0]
+        distance = ((parts[:, None, :] - lattice[None, :, :])**2).sum(axis=2)
+        columns.append(lattice[np.argmin(distance, axis=1)])
+
+    points = np.column_stack(columns)
+
+    # Nearby samples may snap onto the same point.
+    _, first = np.unique(np.round(points, 10), axis=0, return_index=True)
+
+    return points[np.sort(first)]
+
+def concentrationGrid(groups, num, sampling='grid', numSamples=None,
+                      bounds=None, seed=0):
+    """
+    Return the concentrations of compounds as a (npoints, nelements) array.
+    groups is a list of (element indices, total occupation) pairs, the
+    elements of a group share a site, e.g. for the B2 Co(Fe,Mn)(Ga,Si)
+    [([0], 1.0), ([1, 2], 0.5), ([3, 4], 0.5)], and every element is in
+    exactly one group. Each group is spread over a simplex lattice with
+    num points along each edge. The 'grid' sampling returns every
+    combination, with the first group varying the fastest, while the
+    'lhs' and 'sobol' samplings return a subset of numSamples of them.
+    bounds optionally maps element indices to their (minimum, maximum)
+    concentration.
+    """
+    numElements = sum([len(elements) for elements, _ in groups])
+    order = np.concatenate([elements for elements, _ in groups])
+
+    if sorted(order.tolist()) != list(range(numElements)):
+        print('Every element must be in exactly one group.')
+        nmod.nexit()
+
+    if sampling not in SAMPLINGS:
+        print(sampling + ' is not an available sampling, use one of '
+              + ', '.join(SAMPLINGS) + '.')
+        nmod.nexit()
+
+    lattices = [simplexLattice(len(elements), num, total)
+                for elements, total in groups]
+
+    if sampling == 'grid':
+        points = productGrid(lattices)
+    else:
+        points = sampleGrid(lattices, numSamples, sampling, seed)
+
+    # Put the columns back in the order of the elements.
+    points = points[:, np.argsort(order)]
+
+    if bounds is not None:
+        keep = np.ones(len(points), dtype=bool)
+        for element, (low, high) in bounds.items():
+            keep &= ((points[:, element] >= low - 1e-12)
+                     & (points[:, element] <= high + 1e-12))
+        points = points[keep]
+
+    return points
+
+def concentrationPrecision(points, maxPrecision=6):
+    """ Fewest decimal places that represent every concentration exactly """
+    for precision in range(1, maxPrecision):
+        if np.all(np.abs(np.round(points, precision) - points) < 1e-9):
+            return precision
+
+    return maxPrecision
+
+def concentrationNames(points, precision=None):
+    """
+    Return the directory names of the concentrations, e.g.
+    1.000_0.475_0.025_0.500_0.000.
+    """
+    if precision is None:
+        precision = concentrationPrecision(points)
+
+    # Avoid -0.000 from rounding errors.
+    strings = np.char.mod('%.' + str(precision) + 'f',
+                          np.abs(np.round(points, precision)))
+    names = strings[:, 0]
+
+    for column in range(1, strings.shape[1]):
+        names = np.char.add(np.char.add(names, '_'), strings[:, column])
+
+    return names.tolist()
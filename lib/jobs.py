@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 """ Base jobs class for submitting multiple jobs """
 import os
-import inspect
-import subprocess
-import math
 import time
+import inspect
 
 # Import own libraries
 import nmod
+from scheduler import SCHEDULERS, Scheduler, Throttle
+from template import loadTemplate
+from manifest import expectedRuntime, packSize, walltime2str, writeManifest
+from warmstart import finishedPotentials, warmStartOrder
 
 def checkRequired(mainDir, templatesDir, jobsDir):
     """ Check if the required directories and files exist """
@@ -51,94 +53,147 @@ def checkRequired(mainDir, templatesDir, jobsDir):
 def submitSerial():
     """ Submit many serial jobs without overloading the task farm """
 
-def submitArray(mainDir, pbsFile, start, end, **kwargs):
-    """ Submit many array jobs without overloading the task farm """
+def submitArray(mainDir, pbsFile, start=1, end=None, **kwargs):
+    """
+    Submit many array jobs without overloading the task farm.
+    The compounds in jobs/new are written to a manifest, whose line i
+    lists the compounds that the array task i runs one after another.
+    Unless pack is given, as many compounds as fit in the walltime are
+    packed into each task, from the runtime or else the median time
+    taken by the compounds in raw. start and end select the tasks.
+    With warmStart, the manifest lists neighbouring compounds together
+    and every task seeds each compound, just before its SCF, from the
+    nearest compound finished so far, see seed_potential.py.
+    The tasks are submitted in batches whose size and frequency adapt
+    to how fast the queued tasks start, see scheduler.Throttle.
+    The backend is the name of a scheduler in scheduler.SCHEDULERS,
+    or a Scheduler instance such as a configured LocalScheduler.
+    """
     # Define all the required directories.
     baseDir = os.path.join(os.path.dirname(os.path.realpath(
         inspect.getfile(inspect.currentframe()))), '..')
     templatesDir = os.path.join(baseDir, 'templates')
     jobsDir = os.path.join(baseDir, mainDir, 'jobs')
+    rawDir = os.path.join(baseDir, mainDir, 'raw')
 
     # Set default settings.
     settings = {
+        'backend': 'pbs',
+        'user': None,
         'step': 10,
-        'interval': 300
+        'minStep': 1,
+        'maxStep': 100,
+        'interval': 300,
+        'minInterval': 10,
+        'maxInterval': 900,
+        'pack': None,
+        'runtime': None,
+        'walltime': 3600,
+        'warmStart': False,
+        'maxDistance': None
     }
 
     # Replace default settings with user defined settings.
-    for key, value in kwargs.iteritems():
+    for key, value in kwargs.items():
         settings[key] = value
 
+    if isinstance(settings['backend'], Scheduler):
+        scheduler = settings['backend']
+    elif settings['backend'] in SCHEDULERS:
+        scheduler = SCHEDULERS[settings['backend']](settings['user'])
+    else:
+        print(settings['backend'] + ' is not an available scheduler, '
+              + 'use one of ' + ', '.join(sorted(SCHEDULERS)) + '.')
+        nmod.nexit()
+
     if checkRequired(mainDir, templatesDir, jobsDir):
         nmod.nexit()
     else:
         os.chdir(jobsDir)
 
-    iterations = int(math.ceil((end - start) / settings['step']))
-    last = iterations - 1 # Last iteration point for checks later.
-    subCmd = ['qsub', pbsFile]
-    checkInterval = settings['interval']
+    template = loadTemplate(os.path.join(templatesDir, pbsFile))
 
-    timeStart = int(time.time())
-    timePrev = timeStart
+    # A script that does not read the array ID of the scheduler would run
+    # every task on the whole manifest.
+    if (scheduler.arrayVariable is not None
+            and scheduler.arrayVariable not in template.text):
+        print(pbsFile + ' does not read $' + scheduler.arrayVariable
+              + ', it cannot be submitted to ' + type(scheduler).__name__
+              + '.')
+        nmod.nexit()
 
-    # Submit the first batch of jobs.
-    reps = {
-        'tmpTSTART' : start,
-        'tmpTEND'   : settings['step'] + start - 1
-    }
-    nmod.modFile(pbsFile,
-        os.path.join(templatesDir, pbsFile), reps)
-    subprocess.Popen(subCmd)
-
-    for i in range(1, iterations):
-        # Check if any jobs are still idle or blocked.
-        # If there are, check again after an interval.
-        # Only submit the next batch of jobs when there are no queued jobs.
-        time.sleep(3) # Sleep to make sure the jobs are submitted.
-
-        while True:
-            # Read in the showq command as an array separated by newline.
-            p = subprocess.Popen(['showq', '-u', 'phukgm'],
-                                 stdout = subprocess.PIPE,
-                                 stderr = subprocess.PIPE)
-            stdout, _ = p.communicate()
-            stdout = stdout.decode()
-            stdout = stdout.split('\n')
-
-            # Check if queued jobs are non-zero.
-            if ('Idle Jobs: 0' in stdout[-2]
-                    and 'Blocked Jobs: 0' in stdout[-2]):
-                timePrev = time.time()
-                break
-            else:
-                print('There are still idle and blocked jobs after '
-                      + nmod.seconds2str(time.time() - timePrev) + '.')
-                timePrev = time.time()
-                time.sleep(checkInterval) # Check jobs interval.
-
-
-        # Submit the next batch of jobs.
-        # Make sure the last iteration has the correct
-        # ending point of -t (tempTEND).
-        if i == last:
-            print('Submitting -t ' + str(i * settings['step'] + start)
-                  + '-' + str(end) + '...')
+    # Pack the compounds into the array tasks of a new manifest,
+    # neighbouring compounds first on warm starts.
+    newDir = os.path.join(jobsDir, 'new')
+    dirnames = sorted([dirname for dirname in os.listdir(newDir)
+                       if os.path.isdir(os.path.join(newDir, dirname))])
+
+    if settings['warmStart']:
+        dirnames = warmStartOrder(dirnames, finishedPotentials(rawDir))
+
+    pack = settings['pack']
+
+    if pack is None:
+        runtime = settings['runtime']
+        if runtime is None:
+            runtime = expectedRuntime(rawDir)
+        pack = 1 if runtime is None else packSize(runtime,
+                                                  settings['walltime'])
+
+    manifest = 'manifest_' + time.strftime('%Y%m%d-%H%M%S') + '.txt'
+
+    # The command seeding the potential of every compound in the scripts,
+    # run from the compound folder in jobs/new.
+    warmStart = ':'
+    if settings['warmStart']:
+        warmStart = ' '.join(['python', os.path.join(os.path.realpath(
+            baseDir), 'seed_potential.py'), '.', '../../../raw']
+            + ([str(settings['maxDistance'])]
+               if settings['maxDistance'] is not None else []))
+    numTasks = writeManifest(os.path.join(jobsDir, manifest), dirnames, pack)
+
+    if end is None or end > numTasks:
+        end = numTasks
+
+    print('Packed ' + str(len(dirnames)) + ' compounds into '
+          + str(numTasks) + ' array tasks of up to ' + str(pack)
+          + ', listed in ' + manifest + '.')
+
+    throttle = Throttle(*[settings[key] for key in
+                          ['step', 'minStep', 'maxStep', 'interval',
+                           'minInterval', 'maxInterval']])
+    timeStart = scheduler.time()
+    nextTask = start
+
+    while nextTask <= end:
+        # Check how many tasks are still waiting to start,
+        # and only top the queue up to what the farm can start in time.
+        queued, running = scheduler.queued()
+        throttle.observe(scheduler.time(), queued)
+        batchSize = min(throttle.batchSize(queued), end - nextTask + 1)
+
+        if batchSize > 0:
+            batchEnd = nextTask + batchSize - 1
+            print('Submitting -t ' + str(nextTask) + '-' + str(batchEnd)
+                  + ' (' + str(queued) + ' queued, ' + str(running)
+                  + ' running)...')
             reps = {
-                'tmpTSTART' : i * settings['step'] + start,
-                'tmpTEND'   : end
+                'tmpTSTART'   : nextTask,
+                'tmpTEND'     : batchEnd,
+                'tmpMANIFEST' : manifest,
+                'tmpWALLTIME' : walltime2str(settings['walltime']),
+                'tmpWARMSTART': warmStart
             }
+            template.write(pbsFile, reps)
+            scheduler.submit(pbsFile, nextTask, batchEnd)
+            throttle.submitted(batchSize)
+            nextTask = batchEnd + 1
         else:
-            print('Submitting -t ' + str(i * settings['step'] + start)
-                  + '-' + str((i+1) * settings['step'] + start - 1) + '...')
-            reps = {
-                'tmpTSTART' : i * settings['step'] + start,
-                'tmpTEND'   : (i+1) * settings['step'] + start - 1
-            }
+            print('There are still ' + str(queued) + ' queued tasks after '
+                  + nmod.seconds2str(scheduler.time() - timeStart) + '.')
 
-        nmod.modFile(pbsFile,
-            os.path.join(templatesDir, pbsFile), reps)
-        subprocess.Popen(subCmd)
+        if nextTask <= end:
+            scheduler.sleep(throttle.nextInterval())
 
-    timeTaken = nmod.seconds2str(time.time() - timeStart)
+    timeTaken = nmod.seconds2str(scheduler.time() - timeStart)
     print('All jobs submitted. Time taken: ' + timeTaken + '.')
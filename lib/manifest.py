@@ -0,0 +1,62 @@
+""" Manifests packing several compounds into every array task """
+import os
+import re
+import numpy as np
+
+# Import own libraries
+import nmod
+from sink import writeLines
+
+# Last line of a job log, written by the PBS scripts and the local runner.
+TOTAL_TIME = re.compile(r'Total time taken: (\d+)h (\d+)m (\d+)s')
+
+def jobRuntime(logFile):
+    """ Return the time taken by the last run of a job log, or None """
+    if os.path.isfile(logFile) is False:
+        return None
+
+    with open(logFile) as f:
+        matches = TOTAL_TIME.findall(f.read())
+
+    if len(matches) == 0:
+        return None
+
+    hours, minutes, seconds = matches[-1]
+
+    return 3600*int(hours) + 60*int(minutes) + int(seconds)
+
+def expectedRuntime(rawDir):
+    """
+    Return the median time taken by the finished compounds in rawDir,
+    or None if none of them have a log.
+    """
+    if os.path.isdir(rawDir) is False:
+        return None
+
+    runtimes = [jobRuntime(os.path.join(rawDir, dirname, 'nlog'))
+                for dirname in os.listdir(rawDir)]
+    runtimes = [runtime for runtime in runtimes if runtime is not None]
+
+    return float(np.median(runtimes)) if len(runtimes) else None
+
+def packSize(runtime, walltime, fill=0.8):
+    """
+    Return how many compounds of the expected runtime fit one after
+    another in the given fraction of the walltime, at least one.
+    """
+    return max(1, int(fill * walltime // max(runtime, 1)))
+
+def walltime2str(s):
+    """ Return the hh:mm:ss walltime of a job script from seconds """
+    s = int(s)
+    return '%02d:%02d:%02d' % (s // 3600, s // 60 % 60, s % 60)
+
+def writeManifest(filePath, dirnames, pack):
+    """
+    Write the manifest of an array job, line i lists the compounds run
+    by the array task i, pack at a time. Return the number of tasks.
+    """
+    tasks = nmod.chunks(dirnames, pack)
+    writeLines(filePath, [' '.join(task) for task in tasks])
+
+    return len(tasks)
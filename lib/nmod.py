@@ -2,10 +2,12 @@
 import os
 import math
 import numpy as np
-from scipy.interpolate import interp1d
 
 def chunks(l, size):
-    """ Return same size chunks in a list """
+    """
+    Return same size chunks in a list or array,
+    the chunks of an array are views without copying.
+    """
     return [l[i:i+size] for i in range(0, len(l), size)]
 
 def findLine(filename, s):
@@ -19,7 +21,11 @@ def findLine(filename, s):
     return value
 
 def findMean(l):
-    """ Find the mean of a list """
+    """ Find the mean of a list or array """
+    if isinstance(l, np.ndarray):
+        # Pairwise summation keeps the rounding error small.
+        return float(np.mean(l))
+
     return math.fsum(l) / len(l)
 
 def replaceAll(text, reps):
@@ -58,137 +64,329 @@ def modFile(new, tmp, reps):
             for line in ftmp:
                 fnew.write(replaceAll(line, reps))
 
-def getDOS(filePath, spin):
-    """ Store into text file and return DOS data """
-    baseDir = os.path.dirname(os.path.abspath(filePath))
-    filename = os.path.basename(filePath).split('.')[0]
-    outFile = os.path.join(baseDir, filename + '_' + spin + '.txt')
-    dos = []
-    record = False
-
-    if spin == 'up':
-        dataStart = '@target G0.S0'
-    elif spin == 'down':
-        dataStart = '@target G1.S0'
-    else:
-        print('Incorrect spin.')
-        nexit()
+def cachePath(filePath):
+    """ Return the binary cache path of a text data file """
+    return os.path.splitext(filePath)[0] + '.npy'
+
+def saveCache(filePath, data):
+    """ Store data as a float64 binary cache next to its text file """
+    cacheFile = cachePath(filePath)
+    tmpFile = cacheFile + '.tmp'
+
+    with open(tmpFile, 'wb') as f:
+        np.save(f, np.asarray(data, dtype=np.float64))
+
+    os.replace(tmpFile, cacheFile)
+
+def loadCache(filePath):
+    """
+    Return the memory-mapped binary cache of a text data file,
+    or None if it does not exist or is older than the text file.
+    """
+    cacheFile = cachePath(filePath)
+
+    if os.path.isfile(cacheFile) is False:
+        return None
+
+    if (os.path.isfile(filePath) is True
+            and os.path.getmtime(filePath) > os.path.getmtime(cacheFile)):
+        return None
+
+    return np.load(cacheFile, mmap_mode='r')
+
+# Grace datasets holding each spin of the SPR-KKR DOS plots.
+DOS_DATASETS = {
+    'up': 'G0.S0',
+    'down': 'G1.S0'
+}
+
+def parseValues(text, filePath):
+    """
+    Return the numbers of a block of text as a flat array, with the path
+    of the file in the error if one of them is not a number.
+    """
+    try:
+        return np.array(text.split(), dtype=np.float64)
+    except ValueError as e:
+        raise ValueError(filePath + ': ' + str(e))
+
+def readAgr(filePath):
+    """
+    Read every @target dataset of a Grace .agr file in a single pass.
+    Return a dictionary of arrays with one row per point, keyed by the
+    dataset name (e.g. 'G0.S0').
+    """
+    datasets = {}
 
     with open(filePath) as f:
-        for l in f:
-            line = l.rstrip()
+        text = f.read()
+
+    start = text.find('@target ')
+
+    while start != -1:
+        end = text.find('\n', start)
+        if end == -1:
+            break
+        name = text[start+8:end].strip()
+
+        # Skip the remaining directives before the data points,
+        # a truncated file ending on a directive has an empty dataset.
+        while text.startswith('@', end + 1):
+            end = text.find('\n', end + 1)
+            if end == -1:
+                end = len(text)
+                break
 
-            if line == dataStart:
-                record = True
-                continue
+        # The data ends at the first line with a single '&'.
+        dataEnd = text.find('\n&', end)
+        if dataEnd == -1:
+            dataEnd = len(text)
+        block = text[end+1:dataEnd]
 
-            if line == '&':
-                record = False
-                continue
+        firstLine = block[:block.find('\n')] if '\n' in block else block
+        numColumns = max(len(firstLine.split()), 1)
+        datasets[name] = parseValues(block, filePath).reshape(-1, numColumns)
 
-            if record and not '@' in line:
-                x = float(line.split()[0])
-                y = float(line.split()[1])
-                dos.append([x, y])
+        start = text.find('@target ', dataEnd)
 
-    if os.path.isfile(outFile) is True:
-        os.remove(outFile)
+    return datasets
 
-    with open(outFile, 'a+') as f:
-        for x, y in dos:
+def writeData(outFile, data):
+    """
+    Store x and y data as a text file and its binary cache,
+    each written to a temporary file first and then renamed.
+    """
+    tmpFile = outFile + '.tmp'
+
+    with open(tmpFile, 'w') as f:
+        for x, y in np.asarray(data).tolist():
             f.write(str(x) + ' ' + str(y) + '\n')
 
-    return dos
+    os.replace(tmpFile, outFile)
+    saveCache(outFile, data)
+
+def getDOSSpins(filePath, spins=('up', 'down'), outDir=None):
+    """
+    Store into text files and return the DOS data of every spin,
+    reading the .agr file only once.
+    The text files are stored next to the .agr file unless outDir is given.
+    """
+    baseDir = outDir or os.path.dirname(os.path.abspath(filePath))
+    filename = os.path.basename(filePath).split('.')[0]
+    datasets = readAgr(filePath)
+    dosSpins = {}
+
+    for spin in spins:
+        if spin not in DOS_DATASETS:
+            print('Incorrect spin.')
+            nexit()
+
+        outFile = os.path.join(baseDir, filename + '_' + spin + '.txt')
+        dos = datasets.get(DOS_DATASETS[spin], np.empty((0, 2)))[:, :2]
+        writeData(outFile, dos)
+        dosSpins[spin] = dos
 
-def getBSF3D(filePath, spin, numSites):
-    """ Store into text file and return 3D BSF data """
-    baseDir = os.path.dirname(os.path.abspath(filePath))
-    bsfnum = os.path.basename(filePath).split('_')[-2]
+    return dosSpins
+
+def getDOS(filePath, spin):
+    """ Store into text file and return DOS data """
+    return getDOSSpins(filePath, [spin])[spin]
+
+def bsfOutFile(filePath, kind, spin, outDir=None):
+    """
+    Return the path of the processed BSF text file of a raw BSF file,
+    next to the raw file unless outDir is given.
+    """
+    baseDir = outDir or os.path.dirname(os.path.abspath(filePath))
+    parts = os.path.basename(filePath).split('_')
+    bsfnum = parts[-3] if len(parts) >= 3 else ''
     if bsfnum.isdigit() == True:
-        outFile = os.path.join(baseDir, bsfnum + '_bsf3d_' + spin + '.txt')
+        return os.path.join(baseDir, bsfnum + '_' + kind + '_' + spin + '.txt')
+    else:
+        return os.path.join(baseDir, kind + '_' + spin + '.txt')
+
+def bsfSign(spin):
+    """ Return the sign of the spin polarised part of the BSF data """
+    if spin == 'up':
+        return -1
+    elif spin == 'down':
+        return 1
     else:
-        outFile = os.path.join(baseDir, 'bsf3d_' + spin + '.txt')
-    raw = []
-    hashCount = 0 # For determining when to start reading raw data.
+        print('Incorrect spin.')
+        nexit()
 
-    # Get raw data first.
+def readBSF(filePath):
+    """
+    Return the raw BSF values as a flat array.
+    The values are stored after the third '###' line of the file,
+    up to the next '###' line or the end of the file.
+    """
     with open(filePath) as f:
-        for l in f:
-            line = l.rstrip()
+        text = f.read()
+
+    start = 0
+    for _ in range(3):
+        start = text.find('###', start)
+        if start == -1:
+            return np.empty(0)
+        start = text.find('\n', start)
+        if start == -1:
+            return np.empty(0)
+        start += 1
+
+    end = text.find('###', start)
+    if end == -1:
+        end = len(text)
+    else:
+        end = text.rfind('\n', start, end) + 1
+
+    return parseValues(text[start:end], filePath)
 
-            if '###' in line:
+def readBSFRows(filePath, numSites, row):
+    """
+    Return a single row of the first block and of the block before last
+    of the raw BSF data, together with nk.
+    Only the lines holding that row are decoded when the data lines have a
+    fixed width, otherwise the whole file is read.
+    """
+    numUseful = (numSites - 1) * 2
+
+    with open(filePath, 'rb') as f:
+        # Find the start of the data after the third '###' line.
+        hashCount = 0
+        while hashCount < 3:
+            line = f.readline()
+            if not line:
+                break
+            if b'###' in line:
                 hashCount += 1
-                continue
 
-            if hashCount == 3:
-                x = float(line.split()[0])
-                y = float(line.split()[1])
-                raw.append([x, y])
+        start = f.tell()
+        firstLine = f.readline()
+        lineLen = len(firstLine)
+        valuesPerLine = len(firstLine.split())
+        size = os.fstat(f.fileno()).st_size
+        fixedWidth = (valuesPerLine > 0 and (size - start) % lineLen == 0)
+
+        if fixedWidth:
+            numValues = int((size - start) / lineLen) * valuesPerLine
+            nk2 = int(numValues / numUseful)
+            nk = math.isqrt(nk2)
+            fixedWidth = (nk * nk == nk2 and nk2 * numUseful == numValues)
+
+        if fixedWidth:
+            blocks = []
+
+            for first in [row * nk, nk2 * (numUseful - 2) + row * nk]:
+                firstLine = int(first / valuesPerLine)
+                lastLine = int((first + nk - 1) / valuesPerLine) + 1
+                f.seek(start + firstLine * lineLen)
+                chunk = f.read((lastLine - firstLine) * lineLen)
+                values = parseValues(chunk.decode(), filePath)
+                skip = first - firstLine * valuesPerLine
+                blocks.append(values[skip:skip+nk])
+
+            if all(len(block) == nk for block in blocks):
+                return blocks[0], blocks[1], nk
+
+    # Fall back to reading the whole data.
+    raw = readBSF(filePath)
+    nk2 = int(len(raw) / numUseful)
+    nk = math.isqrt(nk2)
+
+    if nk * nk != nk2 or nk2 * numUseful != len(raw):
+        print(filePath + ' does not contain ' + str(numUseful)
+              + ' square blocks of BSF data.')
+        nexit()
+
+    offset = nk2 * (numUseful - 2)
+    return (raw[row*nk:(row+1)*nk], raw[offset+row*nk:offset+(row+1)*nk],
+            nk)
+
+def getBSF3D(filePath, spin, numSites, save=True):
+    """
+    Store into text file (if save is True) and return 3D BSF data.
+    The raw data consist of (numSites - 1) * 2 blocks of nk * nk values,
+    the spin resolved map is the first block plus or minus the block
+    before last.
+    """
+    outFile = bsfOutFile(filePath, 'bsf3d', spin)
+    raw = readBSF(filePath)
 
     # Generate plotable data from raw
     numUseful = (numSites - 1) * 2
-    nk = len(raw) / numUseful
-    nk2 = nk * nk
-    bsf = [[] for i in range(nk)]
+    nk2 = int(len(raw) / numUseful)
+    nk = math.isqrt(nk2)
 
-    if spin == 'up':
-        sign = -1
-    elif spin == 'down':
-        sign = 1
+    if nk * nk != nk2 or nk2 * numUseful != len(raw):
+        print(filePath + ' does not contain ' + str(numUseful)
+              + ' square blocks of BSF data.')
+        nexit()
 
-    for i in range(nk2):
-        n = math.floor(i / nk)
-        j = i + (nk2 * numUseful - 2)
-        bsf[n].append(float(raw[i]) + sign * float(raw[j]))
+    offset = nk2 * (numUseful - 2)
+    bsf = (raw[:nk2] + bsfSign(spin) * raw[offset:offset+nk2]).reshape(nk, nk)
 
-    if os.path.isfile(outFile) is True:
-        os.remove(outFile)
+    if save:
+        if os.path.isfile(outFile) is True:
+            os.remove(outFile)
 
-    np.savetxt(outFile, bsf)
+        np.savetxt(outFile, bsf)
 
     return bsf
 
-def getBSF2D(filePath, spin, numSites):
-    """ Store into text file and return single strip of BSF data """
-    baseDir = os.path.dirname(os.path.abspath(filePath))
-    bsfnum = os.path.basename(filePath).split('_')[-2]
-    if bsfnum.isdigit() == True:
-        outFile = os.path.join(baseDir, bsfnum + '_bsf2d_' + spin + '.txt')
+def getBSF2D(filePath, spin, numSites, save3D=False, outDir=None):
+    """
+    Store into text file and return single strip of BSF data.
+    Only the first strip is read from the raw file,
+    unless the full 3D BSF data is to be saved as well.
+    The text file is stored next to the raw file unless outDir is given.
+    """
+    outFile = bsfOutFile(filePath, 'bsf2d', spin, outDir)
+
+    if save3D:
+        strip = getBSF3D(filePath, spin, numSites)[0]
     else:
-        outFile = os.path.join(baseDir, 'bsf2d_' + spin + '.txt')
-    bsf3D = getBSF3D(filePath, spin, numSites)
-    bsf = []
-    nk = len(bsf3D)
+        first, last, _ = readBSFRows(filePath, numSites, 0)
+        strip = first + bsfSign(spin) * last
 
-    for i in range(nk):
-        bsf.append([ i / nk, bsf3D[0][i]])
-
-    if os.path.isfile(outFile) is True:
-        os.remove(outFile)
-
-    with open(outFile, 'a+') as f:
-        for x, y in bsf:
-            f.write(str(x) + ' ' + str(y) + '\n')
+    nk = len(strip)
+    bsf = np.column_stack((np.arange(nk) / nk, strip))
+    writeData(outFile, bsf)
 
     return bsf
 
 def getInterp1d(data):
-    """ Get interpolated data from a list with x and y values """
-    x, y = [], []
+    """
+    Get a linear interpolation function of data with x and y values,
+    either a list of [x, y] pairs or an array with x and y columns.
+    Like scipy's interp1d, it raises ValueError outside of the x range.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    x, y = data[:, 0], data[:, 1]
+
+    def interp(points):
+        """ Linearly interpolate at the given points """
+        if np.any(points < x[0]) or np.any(points > x[-1]):
+            raise ValueError('A value in points is outside of the '
+                             'interpolation range.')
+        return np.interp(points, x, y)
+
+    return interp
 
-    for X, Y in data:
-        x.append(X)
-        y.append(Y)
+def normalise(inp):
+    """
+    Linearly normalise the input values to range from 0 to 1.
+    All values are 0 if they are equal.
+    """
+    inp = np.asarray(inp, dtype=np.float64)
 
-    return interp1d(x, y)
+    if len(inp) == 0:
+        return inp
 
-def normalise(inp):
-    """ Linearly normalise the input values to range from 0 to 1 """
-    normalised = []
-    xmin = min(inp)
-    xmax = max(inp)
+    xmin = inp.min()
+    xrange = inp.max() - xmin
 
-    for x in inp:
-        normalised.append((x - xmin) / (xmax - xmin))
+    if xrange == 0:
+        return np.zeros_like(inp)
 
-    return normalised
+    return (inp - xmin) / xrange
@@ -0,0 +1,150 @@
+""" Adaptive refinement of the concentration grid from analysis results """
+import os
+import numpy as np
+
+# Import own libraries
+import nmod
+from dataset import parseConcentrations
+
+def readResults(analysisDir, fileName):
+    """
+    Read the normalised results of a metric, e.g. band_gap, as a dictionary
+    of values by compound. Return None if the metric has not been run.
+    """
+    resultsFile = os.path.join(analysisDir, fileName + '_normalised.txt')
+
+    if os.path.isfile(resultsFile) is False:
+        return None
+
+    results = {}
+
+    with open(resultsFile) as f:
+        for line in f:
+            if line.strip():
+                dirname, value = line.split()
+                results[dirname] = float(value)
+
+    return results
+
+def neighbourPairs(points, tolerance=1.01):
+    """
+    Return the (i, j) index pairs, with i < j, of the points that are
+    nearest neighbours of each other, i.e. one grid step apart at the
+    local resolution of the grid.
+    """
+    def distances(rows):
+        """ Distances from some points to all the others """
+        d = np.sqrt(((points[rows, None, :] - points[None, :, :])**2)
+                    .sum(axis=2))
+        d[np.arange(len(rows)), rows] = np.inf
+        return d
+
+    # Compute the distances in chunks of rows to bound the memory used.
+    blocks = nmod.chunks(np.arange(len(points)), 1024)
+    nearest = np.concatenate([distances(rows).min(axis=1)
+                              for rows in blocks])
+    pairs = []
+
+    for rows in blocks:
+        limit = tolerance * np.minimum(nearest[rows, None], nearest[None, :])
+        i, j = np.nonzero(distances(rows) <= limit)
+        i = rows[i]
+        keep = i < j
+        pairs.append(np.column_stack((i[keep], j[keep])))
+
+    return np.concatenate(pairs) if len(pairs) else np.empty((0, 2), int)
+
+def refinePoints(points, values, thresholds=None, fraction=0.1,
+                 maxPoints=None, exclude=None):
+    """
+    Return new concentrations halfway between neighbouring compounds
+    where the metrics change the fastest or cross a threshold, most
+    important first. values is a (ncompounds, nmetrics) array of the
+    normalised metrics, with NaN where a metric is missing, thresholds
+    optionally holds a threshold for each metric. The steepest fraction
+    of the neighbour pairs is refined, as well as every pair crossing a
+    threshold. The points in exclude or already done are skipped.
+    """
+    pairs = neighbourPairs(points)
+
+    if len(pairs) == 0:
+        return np.empty((0, points.shape[1]))
+
+    i, j = pairs[:, 0], pairs[:, 1]
+    change = np.abs(values[i] - values[j])
+    score = np.nanmax(np.where(np.isnan(change), -np.inf, change), axis=1)
+
+    # Pairs whose change is in the steepest fraction of all pairs.
+    finite = np.isfinite(score)
+    selected = np.zeros(len(pairs), dtype=bool)
+
+    if finite.any():
+        cutoff = np.quantile(score[finite], 1 - fraction)
+        selected |= finite & (score >= cutoff) & (score > 0)
+
+    # Pairs on both sides of a threshold, which always come first.
+    if thresholds is not None:
+        for m, threshold in enumerate(thresholds):
+            if threshold is None:
+                continue
+            crossing = ((values[i, m] - threshold)
+                        * (values[j, m] - threshold) < 0)
+            selected |= crossing
+            score = np.where(crossing, np.inf, score)
+
+    order = np.argsort(-score[selected], kind='stable')
+    midpoints = 0.5 * (points[i[selected]] + points[j[selected]])[order]
+
+    # Skip the points that are already done or queued, and duplicates.
+    known = np.round(points if exclude is None
+                     else np.vstack((points, exclude)), 8)
+    knownSet = set(map(tuple, known))
+    newPoints = []
+
+    for point in midpoints:
+        key = tuple(np.round(point, 8))
+        if key not in knownSet:
+            knownSet.add(key)
+            newPoints.append(point)
+
+    if maxPoints is not None:
+        newPoints = newPoints[:maxPoints]
+
+    return np.array(newPoints).reshape(-1, points.shape[1])
+
+def refineResults(mainDir, metrics=('band_gap', 'dos_diff'),
+                  thresholds=None, fraction=0.1, maxPoints=None):
+    """
+    Return the concentrations of the next refinement round of mainDir,
+    from the normalised results of the given metrics in its analysis
+    folder. The compounds in jobs/new and jobs/unsuccessful are skipped.
+    thresholds optionally maps metric file names to a threshold.
+    """
+    results = [readResults(os.path.join(mainDir, 'analysis'), metric)
+               for metric in metrics]
+    metrics = [m for m, r in zip(metrics, results) if r is not None]
+    results = [r for r in results if r is not None]
+
+    if len(results) == 0:
+        print('No analysis results to refine from in '
+              + os.path.join(mainDir, 'analysis') + '.')
+        nmod.nexit()
+
+    dirnames = sorted(set().union(*[r.keys() for r in results]))
+    values = np.array([[r.get(dirname, np.nan) for r in results]
+                       for dirname in dirnames])
+
+    if thresholds is not None:
+        thresholds = [thresholds.get(metric) for metric in metrics]
+
+    queued = []
+    for folder in ['new', 'unsuccessful']:
+        jobsDir = os.path.join(mainDir, 'jobs', folder)
+        if os.path.isdir(jobsDir):
+            queued += [dirname for dirname in os.listdir(jobsDir)
+                       if os.path.isdir(os.path.join(jobsDir, dirname))]
+
+    exclude = parseConcentrations(queued) if len(queued) else None
+
+    return refinePoints(parseConcentrations(dirnames), values, thresholds,
+                        fraction, maxPoints, exclude)
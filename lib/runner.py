@@ -0,0 +1,221 @@
+""" Run the SCF, DOS and BSF calculations of the jobs on a local pool """
+import os
+import glob
+import inspect
+import time
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+# Import own libraries
+import nmod
+from timing import Progress
+from warmstart import finishedPotentials, seedPotential, warmStartOrder
+
+def printToLog(logFile, message, startTime):
+    """ Append a message with the time taken since startTime to the log """
+    with open(logFile, 'a') as f:
+        f.write(message + ' - Time taken: '
+                + nmod.seconds2str(time.time() - startTime) + '\n')
+
+def runStep(jobDir, settings, exe, inpFile, outFile=None):
+    """
+    Run an SPR-KKR program on an input file of the job, under mpirun
+    with the requested number of ranks unless mpirun is None.
+    Return the command line for the log.
+    """
+    cmd = [exe, inpFile]
+
+    if settings['mpirun'] is not None and settings['ranks'] > 0:
+        cmd = [settings['mpirun'], '-np', str(settings['ranks'])] + cmd
+
+    with open(os.path.join(jobDir, outFile or os.devnull), 'w') as out:
+        try:
+            subprocess.call(cmd, cwd=jobDir, stdout=out,
+                            stderr=subprocess.STDOUT)
+        except OSError as e:
+            # A missing program fails the step like a failed calculation.
+            out.write(str(e) + '\n')
+
+    return ' '.join([exe, inpFile] + (['>', outFile] if outFile else []))
+
+def plotDOS(jobDir, settings):
+    """ Create the readable DOS data files and simple DOS plots """
+    dosFile = glob.glob(os.path.join(jobDir, '*DOS.dos'))[0]
+
+    for agrFile in glob.glob(os.path.join(jobDir, '*.agr')):
+        nmod.modFile(agrFile + '.tmp', agrFile,
+                     {'page size': 'page size 2500, 2500\n#'})
+        os.replace(agrFile + '.tmp', agrFile)
+
+    # The plots are only for a quick look, so missing programs are ignored.
+    try:
+        with open(dosFile) as inp, \
+                open(os.path.join(jobDir, '.agr'), 'w') as out:
+            subprocess.call([settings['plot']], cwd=jobDir, stdin=inp,
+                            stdout=out)
+    except OSError:
+        pass
+
+    if settings['grace'] is not None:
+        try:
+            subprocess.call([settings['grace'], 'dos.agr', '-printfile',
+                             'dos.ps'], cwd=jobDir)
+        except OSError:
+            pass
+
+def runJob(jobsDir, rawDir, dirname, settings):
+    """
+    Run the SCF, DOS and BSF chain of a single job in jobs/new, then move
+    it to raw if every step succeeded or to jobs/unsuccessful otherwise.
+    Return whether it succeeded and the log message of the last step.
+    """
+    jobDir = os.path.join(jobsDir, 'new', dirname)
+    logFile = os.path.join(jobDir, 'nlog')
+    jobStart = time.time()
+    stepStart = jobStart
+
+    # Append to or create log file with current time.
+    with open(logFile, 'a') as f:
+        if os.path.getsize(logFile) != 0:
+            f.write('\n\n')
+        f.write('#######################\n# '
+                + time.strftime('%d/%m/%y %H:%M:%S')
+                + '\n#######################\n')
+
+    # Each step is (program, input, output, file pattern it must create,
+    # whether it is skipped without its input), as in the PBS templates
+    # the BSF step only runs if there is a bsf.inp.
+    steps = [
+        (settings['scf'], 'scf.inp', 'scf.out', 'pot.pot_new', False),
+        (settings['gen'], 'dos.inp', None, '*DOS.dos', False),
+        (settings['gen'], 'bsf.inp', None, '*spol.bsf', True)
+    ]
+    success = True
+    message = ''
+
+    # Start from the converged potential of the nearest compound finished
+    # so far, including those finished by the other workers.
+    if settings['warmStart']:
+        neighbour = seedPotential(jobDir, finishedPotentials(rawDir),
+                                  settings['maxDistance'])
+        with open(logFile, 'a') as f:
+            f.write('Warm start: '
+                    + (neighbour if neighbour else 'none, from scratch')
+                    + '\n')
+
+    # Backup initial potential file.
+    shutil.copyfile(os.path.join(jobDir, 'pot.pot'),
+                    os.path.join(jobDir, 'pot.pot_old'))
+
+    for exe, inpFile, outFile, created, optional in steps:
+        command = exe + ' ' + inpFile
+
+        if os.path.isfile(os.path.join(jobDir, inpFile)):
+            command = runStep(jobDir, settings, exe, inpFile, outFile)
+        elif optional:
+            continue
+
+        # Check if the step created its file, if not, move the job
+        # to unsuccessful.
+        if len(glob.glob(os.path.join(jobDir, created))) == 0:
+            message = '!!! ERROR: ' + command
+            printToLog(logFile, message, stepStart)
+            success = False
+            break
+
+        message = 'Successful: ' + command
+        printToLog(logFile, message, stepStart)
+        stepStart = time.time()
+
+        if inpFile == 'scf.inp':
+            # Replace the original potential file with the converged one.
+            shutil.copyfile(os.path.join(jobDir, 'pot.pot_new'),
+                            os.path.join(jobDir, 'pot.pot'))
+        elif inpFile == 'dos.inp' and settings['plot'] is not None:
+            plotDOS(jobDir, settings)
+
+    with open(logFile, 'a') as f:
+        f.write('Total time taken: '
+                + nmod.seconds2str(time.time() - jobStart))
+
+    if success:
+        shutil.move(jobDir, os.path.join(rawDir, dirname))
+    else:
+        shutil.move(jobDir, os.path.join(jobsDir, 'unsuccessful', dirname))
+
+    return success, message
+
+def runLocal(mainDir, **kwargs):
+    """
+    Run every job of mainDir/jobs/new on a local pool of workers,
+    each running its programs with the given number of MPI ranks.
+    With warmStart, the jobs are ordered so that neighbouring compounds
+    finish first and each SCF starts from the nearest finished one.
+    """
+    settings = {
+        'workers': 1,
+        'ranks': 1,
+        'mpirun': 'mpirun',
+        'scf': 'kkrscf6.3MPI',
+        'gen': 'kkrgen6.3MPI',
+        'plot': 'plot_linux-gnu',
+        'grace': 'gracebat',
+        'warmStart': False,
+        'maxDistance': None
+    }
+
+    # Replace default settings with user defined settings.
+    for key, value in kwargs.items():
+        settings[key] = value
+
+    baseDir = os.path.join(os.path.dirname(os.path.realpath(
+        inspect.getfile(inspect.currentframe()))), '..')
+    mainDir = os.path.join(baseDir, mainDir)
+    jobsDir = os.path.join(mainDir, 'jobs')
+    newDir = os.path.join(jobsDir, 'new')
+    rawDir = os.path.join(mainDir, 'raw')
+
+    if os.path.isdir(newDir) is False:
+        print('The directory provided does not have a jobs/new folder.')
+        nmod.nexit()
+
+    for folder in [rawDir, os.path.join(jobsDir, 'unsuccessful')]:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    dirnames = sorted([dirname for dirname in os.listdir(newDir)
+                       if os.path.isdir(os.path.join(newDir, dirname))])
+    if settings['warmStart']:
+        dirnames = warmStartOrder(dirnames, finishedPotentials(rawDir))
+
+    numData = len(dirnames)
+    progress = Progress(numData)
+    failed = []
+    startTime = time.time()
+
+    print('Running ' + str(numData) + ' jobs with ' + str(settings['workers'])
+          + ' workers of ' + str(settings['ranks']) + ' ranks...')
+
+    executor = ProcessPoolExecutor(max_workers=settings['workers'])
+
+    try:
+        for dirname, (success, message) in zip(dirnames, executor.map(
+                runJob, [jobsDir] * numData, [rawDir] * numData, dirnames,
+                [settings] * numData)):
+            if not success:
+                failed.append([dirname, message])
+            progress.update()
+    finally:
+        executor.shutdown()
+
+    print('')
+
+    if len(failed) != 0:
+        print(str(len(failed)) + ' jobs were moved to '
+              + os.path.join(jobsDir, 'unsuccessful') + ':')
+        print(nmod.ntabulate(failed))
+
+    print(str(numData - len(failed)) + '/' + str(numData)
+          + ' jobs completed. Time taken: '
+          + nmod.seconds2str(time.time() - startTime))
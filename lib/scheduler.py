@@ -0,0 +1,210 @@
+""" Batch scheduler backends for submitting array jobs """
+import re
+import time
+import getpass
+import subprocess
+
+def runCommand(cmd):
+    """ Run a command and return its standard output """
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = p.communicate()
+
+    if p.returncode != 0:
+        raise RuntimeError(' '.join(cmd) + ' failed: '
+                           + stderr.decode().strip())
+
+    return stdout.decode()
+
+class Scheduler(object):
+    """
+    Batch scheduler interface. submit() submits an array job script for
+    the tasks start to end, and queued() returns the number of queued
+    (waiting to start) and running tasks of the user. The scripts must
+    read the array ID of each task from arrayVariable.
+    """
+    arrayVariable = None
+
+    def __init__(self, user=None):
+        self.user = user if user is not None else getpass.getuser()
+
+    def submit(self, scriptFile, start, end):
+        raise NotImplementedError
+
+    def queued(self):
+        raise NotImplementedError
+
+    def time(self):
+        """ Current time, which the fake scheduler can simulate """
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class PBSScheduler(Scheduler):
+    """ PBS/Torque with qsub, the job counts are read from Moab's showq """
+    arrayVariable = 'PBS_ARRAYID'
+
+    def submit(self, scriptFile, start, end):
+        return runCommand(['qsub', scriptFile]).strip()
+
+    def queued(self):
+        stdout = runCommand(['showq', '-u', self.user])
+
+        # e.g. 'Total Jobs: 12   Active Jobs: 8   Idle Jobs: 3
+        #       Blocked Jobs: 1'
+        counts = dict([(name, int(number)) for name, number in
+                       re.findall(r'(Active|Idle|Blocked) Jobs:\s*(\d+)',
+                                  stdout)])
+
+        return (counts.get('Idle', 0) + counts.get('Blocked', 0),
+                counts.get('Active', 0))
+
+class SlurmScheduler(Scheduler):
+    """
+    Slurm with sbatch and squeue. The array range is passed to sbatch,
+    so the script must use $SLURM_ARRAY_TASK_ID and $SLURM_SUBMIT_DIR,
+    as the array templates do when they do not run under PBS.
+    """
+    arrayVariable = 'SLURM_ARRAY_TASK_ID'
+
+    def submit(self, scriptFile, start, end):
+        return runCommand(['sbatch', '--parsable',
+                           '--array=' + str(start) + '-' + str(end),
+                           scriptFile]).strip()
+
+    def queued(self):
+        stdout = runCommand(['squeue', '-u', self.user, '-h', '-r',
+                             '-o', '%T'])
+        states = stdout.split()
+
+        return (len([s for s in states if s == 'PENDING']),
+                len([s for s in states if s in ('RUNNING', 'COMPLETING')]))
+
+class LocalScheduler(Scheduler):
+    """
+    Fake scheduler running on a simulated clock, for testing the
+    submission throttling without a cluster. Tasks take runtime seconds
+    each and at most slots of them run at the same time.
+    """
+    def __init__(self, user=None, slots=8, runtime=600.0):
+        Scheduler.__init__(self, user)
+        self.slots = slots
+        self.runtime = runtime
+        self.clock = 0.0
+        self.pending = []
+        self.running = []
+        self.submitted = []
+
+    def submit(self, scriptFile, start, end):
+        self.submitted.append((self.clock, start, end))
+        self.pending += list(range(start, end + 1))
+        self.advance(0)
+        return 'local.' + str(len(self.submitted))
+
+    def advance(self, seconds):
+        """ Move the clock forward, finishing and starting tasks """
+        target = self.clock + seconds
+
+        while True:
+            # Start queued tasks in any free slot.
+            while len(self.running) < self.slots and len(self.pending) != 0:
+                self.pending.pop(0)
+                self.running.append(self.clock + self.runtime)
+
+            if len(self.running) == 0 or min(self.running) > target:
+                break
+
+            # Finish the next task.
+            self.clock = min(self.running)
+            self.running.remove(self.clock)
+
+        self.clock = target
+
+    def queued(self):
+        return len(self.pending), len(self.running)
+
+    def time(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+SCHEDULERS = {
+    'pbs': PBSScheduler,
+    'slurm': SlurmScheduler,
+    'local': LocalScheduler
+}
+
+class Throttle(object):
+    """
+    Decide how many tasks to submit and how long to wait before checking
+    the queue again, from the rate at which queued tasks start running.
+    The queue is kept deep enough to last for two checks, so that the
+    task farm never runs out of work, but no deeper. The batch size
+    doubles every time the queue is found empty.
+    """
+    def __init__(self, step=10, minStep=1, maxStep=100, interval=300,
+                 minInterval=10, maxInterval=900):
+        self.step = step
+        self.minStep = minStep
+        self.maxStep = maxStep
+        self.interval = interval
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.rate = None
+        self.prevTime = None
+        self.prevQueued = 0
+        self.numSubmitted = 0
+
+    def observe(self, now, queued):
+        """ Update the rate of tasks starting from the queue """
+        numQueued = self.prevQueued + self.numSubmitted
+
+        if self.prevTime is not None and now > self.prevTime \
+                and numQueued > 0:
+            rate = max(numQueued - queued, 0) / (now - self.prevTime)
+
+            # Exponential moving average of the start rate.
+            self.rate = rate if self.rate is None else \
+                0.5 * self.rate + 0.5 * rate
+
+            # The farm ran out of work, so submit more at once.
+            if queued == 0:
+                self.step = min(self.maxStep, 2 * self.step)
+
+        self.prevTime = now
+        self.prevQueued = queued
+        self.numSubmitted = 0
+
+    def submitted(self, numTasks):
+        """ Count the tasks submitted since the last check """
+        self.numSubmitted += numTasks
+
+    def nextInterval(self):
+        """ Time to wait before checking the queue again """
+        if self.rate is None:
+            return self.minInterval
+
+        if self.rate == 0:
+            return self.interval
+
+        # Check again by the time a batch of tasks should have started.
+        return max(self.minInterval,
+                   min(self.maxInterval, self.step / self.rate))
+
+    def batchSize(self, queued):
+        """ Number of tasks to submit with this many tasks already queued """
+        if self.rate is None or self.rate == 0:
+            return self.step if queued == 0 else 0
+
+        target = self.rate * 2 * self.nextInterval()
+
+        if queued == 0:
+            target = max(target, self.step)
+
+        size = int(round(target - queued))
+
+        if size <= 0:
+            return 0
+
+        return max(self.minStep, min(self.maxStep, size))
@@ -0,0 +1,158 @@
+""" Buffered writers for the results of the analyses """
+import os
+import csv
+import sqlite3
+import numpy as np
+
+# Import own libraries
+import nmod
+
+TABLE_FORMATS = ['csv', 'npz', 'sqlite']
+
+def writeLines(filePath, lines):
+    """ Write lines to a file at once, replacing it atomically """
+    tmpFile = filePath + '.tmp'
+
+    with open(tmpFile, 'w') as f:
+        f.write(''.join([line + '\n' for line in lines]))
+
+    os.replace(tmpFile, filePath)
+
+class ResultSink(object):
+    """
+    Keep the results of several metrics in memory, keyed by compound,
+    and write them all at once when flushed.
+    """
+    def __init__(self, outDir, metrics, dirnames):
+        self.outDir = outDir
+        self.metrics = metrics
+        self.dirnames = dirnames
+        self.rows = [{} for _ in metrics]
+
+    def add(self, i, dirname, result):
+        """ Buffer the result of the i-th metric for a compound """
+        self.rows[i][dirname] = result
+
+    def columns(self, i):
+        """
+        Return the compounds with a result for the i-th metric, in order,
+        with their metric values, normalised values and all the columns.
+        """
+        metric = self.metrics[i]
+        dirnames = [d for d in self.dirnames if d in self.rows[i]]
+        results = [self.rows[i][d] for d in dirnames]
+
+        if 'columns' in metric:
+            values = [result[0] for result in results]
+        else:
+            values = results
+
+        normalised = nmod.normalise([metric['sign'] * value
+                                     for value in values])
+
+        return dirnames, values, normalised, results
+
+    def flush(self):
+        """ Write every buffered result """
+        if not os.path.isdir(self.outDir):
+            os.makedirs(self.outDir)
+
+        self.write()
+
+    def write(self):
+        """ Write the results, implemented by each kind of sink """
+        raise NotImplementedError
+
+class TextSink(ResultSink):
+    """
+    Results and normalised results of each metric in their own text files,
+    as '<concentrations> <value>' lines.
+    """
+    def write(self):
+        for i, metric in enumerate(self.metrics):
+            dirnames, values, normalised, results = self.columns(i)
+            outFile = os.path.join(self.outDir, metric['fileName'])
+
+            # Store every column of the results in their own file.
+            if 'columns' in metric:
+                writeLines(outFile + '_columns.txt',
+                           ['# concentrations ' + ' '.join(metric['columns'])]
+                           + [dirname + ' ' + ' '.join([str(x) for x in result])
+                              for dirname, result in zip(dirnames, results)])
+
+            writeLines(outFile + '.txt',
+                       [dirname + ' ' + str(value)
+                        for dirname, value in zip(dirnames, values)])
+            writeLines(outFile + '_normalised.txt',
+                       [dirname + ' ' + str(value)
+                        for dirname, value in zip(dirnames, normalised)])
+
+class TableSink(ResultSink):
+    """
+    Results of all the metrics in a single results.<format> table with
+    a row per compound, where format is csv, npz or sqlite.
+    Missing results are empty in csv, NaN in npz and NULL in sqlite.
+    """
+    def __init__(self, outDir, metrics, dirnames, tableFormat='csv'):
+        ResultSink.__init__(self, outDir, metrics, dirnames)
+        self.tableFormat = tableFormat
+        self.tableFile = os.path.join(outDir, 'results.' + tableFormat)
+
+    def table(self):
+        """ Return the column names and the (ncompounds, ncolumns) values """
+        header = []
+        tableColumns = []
+        rows = dict([(dirname, n) for n, dirname in enumerate(self.dirnames)])
+
+        for i, metric in enumerate(self.metrics):
+            dirnames, values, normalised, results = self.columns(i)
+            names = [metric['fileName'], metric['fileName'] + '_normalised']
+            columns = [values, normalised]
+
+            for j, column in enumerate(metric.get('columns', [])[1:]):
+                names.append(metric['fileName'] + '_' + column)
+                columns.append([result[j+1] for result in results])
+
+            index = [rows[dirname] for dirname in dirnames]
+
+            for name, column in zip(names, columns):
+                full = np.full(len(self.dirnames), np.nan)
+                full[index] = column
+                header.append(name)
+                tableColumns.append(full)
+
+        return header, np.column_stack(tableColumns)
+
+    def write(self):
+        header, values = self.table()
+        tmpFile = self.tableFile + '.tmp'
+
+        if self.tableFormat == 'csv':
+            with open(tmpFile, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['concentrations'] + header)
+                for dirname, row in zip(self.dirnames, values):
+                    writer.writerow([dirname] + ['' if np.isnan(x) else repr(x)
+                                                 for x in row.tolist()])
+        elif self.tableFormat == 'npz':
+            with open(tmpFile, 'wb') as f:
+                np.savez(f, concentrations=np.array(self.dirnames),
+                         columns=np.array(header), values=values)
+        else:
+            if os.path.isfile(tmpFile):
+                os.remove(tmpFile)
+            connection = sqlite3.connect(tmpFile)
+            with connection:
+                connection.execute(
+                    'CREATE TABLE results (concentrations TEXT PRIMARY KEY, '
+                    + ', '.join(['"' + name + '" REAL' for name in header])
+                    + ')')
+                connection.executemany(
+                    'INSERT INTO results VALUES ('
+                    + ', '.join(['?'] * (len(header) + 1)) + ')',
+                    [[dirname] + [None if np.isnan(x) else x
+                                  for x in row.tolist()]
+                     for dirname, row in zip(self.dirnames, values)])
+            connection.close()
+
+        os.replace(tmpFile, self.tableFile)
@@ -0,0 +1,68 @@
+""" Templates with tmp* placeholders, read once and filled in one pass """
+import os
+import re
+
+# Placeholders are the whole tmp word, so tmpCONC1 never matches a
+# shorter tmpCONC key and tmpCONC10 never matches tmpCONC1.
+PLACEHOLDER = re.compile(r'tmp[A-Za-z0-9]+')
+
+# Loaded templates and element tables by path and modification time.
+loaded = {}
+
+class Template(object):
+    """ Text with tmp* placeholders """
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, reps):
+        """
+        Return the text with every placeholder found in reps replaced by
+        its value, the other placeholders are left as they are.
+        """
+        reps = dict([(str(key), str(value)) for key, value in reps.items()])
+
+        return PLACEHOLDER.sub(lambda m: reps.get(m.group(0), m.group(0)),
+                               self.text)
+
+    def write(self, filePath, reps):
+        """ Write the rendered text to a file """
+        with open(filePath, 'w') as f:
+            f.write(self.render(reps))
+
+def cached(filePath, parse):
+    """ Return parse(filePath), parsed again only if the file changed """
+    key = (os.path.realpath(filePath), parse)
+    mtime = os.path.getmtime(filePath)
+
+    if key not in loaded or loaded[key][0] != mtime:
+        loaded[key] = (mtime, parse(filePath))
+
+    return loaded[key][1]
+
+def parseTemplate(filePath):
+    """ Read a template file """
+    with open(filePath) as f:
+        return Template(f.read())
+
+def parseElements(filePath):
+    """
+    Read the elements table, a header line followed by lines starting
+    with the element symbol. Return the line of every element.
+    """
+    elements = {}
+
+    with open(filePath) as f:
+        next(f)
+        for line in f:
+            if line.strip():
+                elements.setdefault(line.split()[0], line.strip())
+
+    return elements
+
+def loadTemplate(filePath):
+    """ Return the Template of a file, read only once """
+    return cached(filePath, parseTemplate)
+
+def loadElements(filePath):
+    """ Return the element lines of an elements table, read only once """
+    return cached(filePath, parseElements)
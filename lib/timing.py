@@ -0,0 +1,135 @@
+""" Timing instrumentation and run reports for the analyses """
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Import own libraries
+import nmod
+
+class StageTimer(object):
+    """ Accumulate the time spent in each stage of some work """
+    def __init__(self):
+        self.timings = {}
+
+    def add(self, stage, seconds):
+        """ Add time to a stage """
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage):
+        """ Time the enclosed block as part of a stage """
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - startTime)
+
+class Progress(object):
+    """ Print the number of items left and the estimated time left """
+    def __init__(self, numData):
+        self.numData = numData
+        self.numDataLeft = numData
+        self.prevTime = time.time()
+        self.eachTimeTaken = []
+
+    def update(self):
+        """ Mark one more item as done """
+        self.eachTimeTaken.append(time.time() - self.prevTime)
+        self.prevTime = time.time()
+        self.numDataLeft -= 1
+        sys.stdout.write('\r' + str(self.numDataLeft) + '/'
+                         + str(self.numData) + ' - Time left: '
+                         + nmod.seconds2str(nmod.findMean(self.eachTimeTaken)
+                                            * self.numDataLeft)
+                         + '         ')
+        sys.stdout.flush()
+
+class RunReport(object):
+    """ Per compound and per run stage timings of a single analysis run """
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.startTime = time.time()
+        self.compounds = {}
+        self.run = StageTimer()
+
+    def addCompound(self, dirname, timings):
+        """ Store the stage timings of a compound """
+        self.compounds[dirname] = timings
+
+    def summary(self, numSlowest=10):
+        """ Return the report as a dictionary """
+        stages = sorted(set([stage for timings in self.compounds.values()
+                             for stage in timings]))
+        totals = dict([(dirname, sum(timings.values()))
+                       for dirname, timings in self.compounds.items()])
+        statistics = {}
+
+        for stage in stages + ['total'] if len(totals) else []:
+            if stage == 'total':
+                values = np.array(list(totals.values()))
+            else:
+                values = np.array([timings.get(stage, 0.0)
+                                   for timings in self.compounds.values()])
+
+            statistics[stage] = {
+                'sum': float(values.sum()),
+                'mean': float(values.mean()),
+                'p50': float(np.percentile(values, 50)),
+                'p90': float(np.percentile(values, 90)),
+                'p99': float(np.percentile(values, 99)),
+                'max': float(values.max())
+            }
+
+        slowest = sorted(totals, key=totals.get, reverse=True)[:numSlowest]
+
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                     time.localtime(self.startTime)),
+            'wallTime': time.time() - self.startTime,
+            'metrics': self.metrics,
+            'numCompounds': len(self.compounds),
+            'compoundStages': statistics,
+            'runStages': self.run.timings,
+            'slowest': [dict([('compound', dirname), ('total', totals[dirname])]
+                             + list(self.compounds[dirname].items()))
+                        for dirname in slowest],
+            'compounds': self.compounds
+        }
+
+    def save(self, reportFile):
+        """ Write the report as JSON and return its summary """
+        summary = self.summary()
+        reportDir = os.path.dirname(reportFile)
+
+        if not os.path.isdir(reportDir):
+            os.makedirs(reportDir)
+
+        with open(reportFile, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+        return summary
+
+def printSummary(summary):
+    """ Print how the compound time was split between the stages """
+    stages = summary['compoundStages']
+
+    if len(stages) == 0:
+        return
+
+    total = stages['total']['sum']
+    table = [['stage', 'total', 'share', 'p50', 'p90', 'max']]
+
+    for stage, statistics in stages.items():
+        if stage == 'total':
+            continue
+        table.append([stage, '{:.3f}s'.format(statistics['sum']),
+                      '{:.0f}%'.format(100 * statistics['sum'] / total
+                                       if total > 0 else 0),
+                      '{:.4f}s'.format(statistics['p50']),
+                      '{:.4f}s'.format(statistics['p90']),
+                      '{:.4f}s'.format(statistics['max'])])
+
+    print(nmod.ntabulate(table))
@@ -0,0 +1,142 @@
+""" Start the SCF of new compounds from converged neighbouring compounds """
+import os
+import re
+import numpy as np
+
+# Import own libraries
+from dataset import parseConcentrations
+
+def finishedPotentials(rawDir):
+    """
+    Return rawDir with the names and the concentrations of its compounds
+    that have a converged potential file, pot.pot_new.
+    """
+    names = []
+
+    if os.path.isdir(rawDir):
+        names = sorted([dirname for dirname in os.listdir(rawDir)
+                        if os.path.isfile(os.path.join(rawDir, dirname,
+                                                       'pot.pot_new'))])
+
+    points = parseConcentrations(names) if len(names) else np.empty((0, 0))
+
+    return rawDir, names, points
+
+def nearestFinished(point, finished, maxDistance=None):
+    """
+    Return the name of the finished compound closest to the concentrations
+    of point, or None if there is none within maxDistance.
+    """
+    _, names, points = finished
+
+    if len(names) == 0 or points.shape[1] != len(point):
+        return None
+
+    distance = np.sqrt(((points - point)**2).sum(axis=1))
+    nearest = np.argmin(distance)
+
+    if maxDistance is not None and distance[nearest] > maxDistance:
+        return None
+
+    return names[nearest]
+
+def rewritePotential(text, concentrations, system):
+    """
+    Return the potential file text with the concentrations of every type
+    in OCCUPATION, the SYSTEM name replaced and SCFSTATUS set to ITR,
+    so that the SCF carries on from the potential instead of starting
+    from scratch.
+    """
+    lines = text.split('\n')
+    section = None
+
+    for n, line in enumerate(lines):
+        if line.startswith('SYSTEM '):
+            lines[n] = 'SYSTEM    ' + system
+        elif line.startswith('SCFSTATUS'):
+            lines[n] = 'SCFSTATUS ITR'
+        elif line.startswith('*'):
+            section = None
+        elif line.strip() and not line[0].isspace():
+            section = line.split()[0]
+        elif (section == 'OCCUPATION' and line.strip()
+              and line.split()[0] != 'IQ'):
+            # IQ IREFQ IMQ NOQ followed by NOQ pairs of ITOQ CONC,
+            # the concentrations are replaced in place.
+            tokens = list(re.finditer(r'\S+', line))
+            newLine = line
+            for itoq, conc in reversed(list(zip(tokens[4::2],
+                                                tokens[5::2]))):
+                newLine = (newLine[:conc.start()]
+                           + concentrations[int(itoq.group()) - 1]
+                           + newLine[conc.end():])
+            lines[n] = newLine
+
+    return '\n'.join(lines)
+
+def seedPotential(jobDir, finished, maxDistance=None):
+    """
+    Replace the starting pot.pot of a job, named after its concentrations,
+    with the converged potential of the nearest finished compound,
+    finished being returned by finishedPotentials.
+    Return the name of that compound, or None if the job starts
+    from scratch.
+    """
+    dirname = os.path.basename(os.path.abspath(jobDir))
+    concentrations = dirname.split('_')
+    point = np.array([float(c) for c in concentrations])
+    neighbour = nearestFinished(point, finished, maxDistance)
+
+    if neighbour is None:
+        return None
+
+    potFile = os.path.join(jobDir, 'pot.pot')
+    system = dirname
+
+    # Keep the SYSTEM name that the job was created with.
+    with open(potFile) as f:
+        for line in f:
+            if line.startswith('SYSTEM '):
+                system = line.split(None, 1)[1].strip()
+                break
+
+    with open(os.path.join(finished[0], neighbour, 'pot.pot_new')) as f:
+        text = f.read()
+
+    with open(potFile + '.tmp', 'w') as f:
+        f.write(rewritePotential(text, concentrations, system))
+    os.replace(potFile + '.tmp', potFile)
+
+    return neighbour
+
+def warmStartOrder(dirnames, finished):
+    """
+    Order new compounds so that each one comes as soon as possible after
+    the compounds closest to it, starting next to the finished compounds,
+    so that most jobs can start from a converged neighbour.
+    """
+    if len(dirnames) == 0:
+        return []
+
+    points = parseConcentrations(dirnames)
+    _, names, done = finished
+
+    if len(names) != 0 and done.shape[1] == points.shape[1]:
+        nearest = np.array([np.sqrt(((done - p)**2).sum(axis=1)).min()
+                            for p in points])
+    else:
+        nearest = np.full(len(points), np.inf)
+        nearest[0] = 0.0
+
+    # Greedily take the compound closest to all those done or taken.
+    order = []
+    left = np.ones(len(points), dtype=bool)
+
+    for _ in range(len(points)):
+        n = int(np.argmin(np.where(left, nearest, np.inf)))
+        order.append(dirnames[n])
+        left[n] = False
+        nearest = np.minimum(nearest,
+                             np.sqrt(((points - points[n])**2).sum(axis=1)))
+
+    return order
@@ -0,0 +1,94 @@
+""" Watch the raw folder and analyse compounds as they are finished """
+import os
+import time
+
+# inotify is optional, the raw folder is polled without it.
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# Import own libraries
+from convert import convertCompound
+
+def unconverted(rawDir, dataDir):
+    """ Return the raw compounds that are not yet in the data folder """
+    if os.path.isdir(rawDir) is False:
+        return []
+
+    return sorted([dirname for dirname in os.listdir(rawDir)
+                   if os.path.isdir(os.path.join(rawDir, dirname))
+                   and not os.path.isdir(os.path.join(dataDir, dirname))])
+
+class RawWatcher(object):
+    """ Wait for new directories in the raw folder """
+    def __init__(self, rawDir, interval):
+        self.rawDir = rawDir
+        self.interval = interval
+        self.inotify = None
+
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(rawDir, flags.CREATE | flags.MOVED_TO)
+            except OSError:
+                print('inotify is not available, polling ' + rawDir
+                      + ' every ' + str(interval) + 's instead.')
+                self.inotify = None
+
+    def wait(self):
+        """ Block until something may have changed in the raw folder """
+        if self.inotify is None:
+            time.sleep(self.interval)
+        else:
+            # Wait for a first event, then give the rest of a batch of moves
+            # a second to arrive so that they are analysed together.
+            if len(self.inotify.read(timeout=self.interval * 1000)) != 0:
+                self.inotify.read(timeout=1000, read_delay=1000)
+
+def watch(analysis, metrics, interval=60, convert=True):
+    """
+    Convert and analyse new compounds whenever they land in the raw folder
+    of the analysis, until interrupted.
+    Only new or changed compounds are analysed thanks to the result cache,
+    the normalised outputs are rewritten every round.
+    """
+    if os.path.isdir(analysis.rawDir) is False:
+        os.makedirs(analysis.rawDir)
+
+    watcher = RawWatcher(analysis.rawDir, interval)
+    failed = set()
+    numDone = -1
+
+    print('Watching ' + analysis.rawDir + ' (Ctrl-C to stop)...')
+
+    try:
+        while True:
+            # Convert any new compounds to the data folder.
+            if convert:
+                for dirname in unconverted(analysis.rawDir, analysis.dataDir):
+                    if dirname in failed:
+                        continue
+
+                    try:
+                        convertCompound(analysis.rawDir, analysis.dataDir,
+                                        dirname)
+                        print(dirname + ' has been converted.')
+                    except (Exception, SystemExit) as e:
+                        print('Could not convert ' + dirname + ': ' + str(e))
+                        failed.add(dirname)
+
+            # Analyse the new compounds and update the normalised outputs.
+            # The compounds failing a metric are skipped by the analysis,
+            # and a failed run is only tried again once new compounds land.
+            numData = len(analysis.refresh())
+            if numData != 0 and numData != numDone:
+                numDone = numData
+                try:
+                    analysis.run(metrics)
+                except (Exception, SystemExit) as e:
+                    print('Analysis failed: ' + str(e))
+
+            watcher.wait()
+    except KeyboardInterrupt:
+        print('\nStopped watching ' + analysis.rawDir + '.')
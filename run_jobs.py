@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+""" Run jobs on a local pool of workers """
+import os
+import sys
+import inspect
+
+# Add extra libraries' directories to import list
+baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe()))), 'lib')
+
+sys.path.append(baseLibDir)
+
+# Import own libraries
+import runner
+
+if __name__ == '__main__':
+    runner.runLocal('CFMGS/B2', workers=4, ranks=2, warmStart=True)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+""" Seed the potential of a job from the nearest finished compound """
+import os
+import sys
+import inspect
+
+baseDir = os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe())))
+baseLibDir = os.path.join(baseDir, 'lib')
+
+sys.path.append(baseLibDir)
+
+# Import own libraries
+from warmstart import finishedPotentials, seedPotential
+
+if __name__ == '__main__':
+    # Usage: seed_potential.py jobDir rawDir [maxDistance]
+    # Run by the array job scripts at the start of every compound,
+    # so that it starts from the compounds finished so far.
+    jobDir, rawDir = sys.argv[1], sys.argv[2]
+    maxDistance = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    neighbour = seedPotential(jobDir, finishedPotentials(rawDir), maxDistance)
+    print('Warm start: ' + (neighbour if neighbour else 'none, from scratch'))
@@ -14,5 +14,5 @@ sys.path.append(baseLibDir)
 import jobs
 
 if __name__ == '__main__':
-    jobs.submitArray('CFMGS/L21', 'array_mpi_l21.pbs', 1, 441,
-                     step=10, interval=300)
+    jobs.submitArray('CFMGS/L21', 'array_mpi_l21.pbs', backend='pbs',
+                     step=10, interval=300, walltime=3600)
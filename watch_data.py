@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+""" Convert and analyse compounds as soon as they land in the raw folder """
+import os
+import sys
+import inspect
+
+# Add extra libraries' directories to import list
+baseLibDir = os.path.join(os.path.realpath(os.path.dirname(
+    inspect.getfile(inspect.currentframe()))), 'lib')
+
+sys.path.append(baseLibDir)
+
+# Import own libraries
+from analysis import Analysis
+from watch import watch
+
+if __name__ == '__main__':
+    analysis = Analysis('CFMGS/B2', workers=os.cpu_count(), allowEmpty=True)
+    watch(analysis, [
+        ('bandGap', {'aInit': -0.5, 'stripSize': 0.4, 'stepSize': 0.05}),
+        ('dosDiff', {'vincinity': 0.6})
+    ], interval=60)